@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+
+###############################################################################
+#         ╔╦╗┌─┐┌─┐┬┌─┐  ╔═╗┬┬─┐┌─┐┬ ┬┬┌┬┐  ╔═╗┬┌┬┐┬ ┬┬  ┌─┐┌┬┐┌─┐┬─┐         #
+#         ║║║├─┤│ ┬││    ║  │├┬┘│  │ ││ │   ╚═╗│││││ ││  ├─┤ │ │ │├┬┘         #
+#         ╩ ╩┴ ┴└─┘┴└─┘  ╚═╝┴┴└─└─┘└─┘┴ ┴   ╚═╝┴┴ ┴└─┘┴─┘┴ ┴ ┴ └─┘┴└─         #
+# -+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+- #
+#                                                                        2014 #
+#                                                           Sébastien MAGNIEN #
+#                                                            Mathieu FOURCROY #
+# --------------------------------------------------------------------------- #
+# Bit-parallel simulation: bit k of a Python integer holds the value of a net #
+# for the input vector k, so one pass over a combinational netlist evaluates  #
+# as many vectors as wanted. A three-valued net uses two integers (planes):   #
+# ones has the bits of the True values, unknowns the bits of the None values. #
+###############################################################################
+
+
+def pack_vectors(vectors, nbInputs):
+    """Return the ones and unknowns planes of each input for a list of
+    input vectors (tuples of True, False or None).
+    """
+    ones = [0] * nbInputs
+    unknowns = [0] * nbInputs
+    for k, vector in enumerate(vectors):
+        bit = 1 << k
+        for i, value in enumerate(vector):
+            if value is None:
+                unknowns[i] |= bit
+            elif value:
+                ones[i] |= bit
+    return ones, unknowns
+
+
+def unpack_plane(one, unknown, width):
+    """Return the values of a net for each of the width vectors."""
+    return [
+        None if unknown >> k & 1 else bool(one >> k & 1)
+        for k in range(width)]
+
+
+def evaluate_planes(netlist, ones, unknowns, width):
+    """Evaluate a combinational netlist for width vectors at once. ones and
+    unknowns are the planes of the netlist inputs, return the planes of
+    every net. The nets driven by nothing keep their netlist value.
+    """
+    if not netlist.is_combinational():
+        raise ValueError(
+            "%s has a loop or a flip-flop, it can't be evaluated in parallel."
+            % (netlist.circuit.name,))
+    mask = (1 << width) - 1
+    netOnes = [mask if value else 0 for value in netlist.values]
+    netUnknowns = [mask if value is None else 0 for value in netlist.values]
+    for net, one, unknown in zip(netlist.inputs, ones, unknowns):
+        netOnes[net] = one
+        netUnknowns[net] = unknown
+    gates = netlist.gates
+    gateInputs = netlist.gateInputs
+    gateOutputs = netlist.gateOutputs
+    for gate in netlist.ranks:
+        inputs = gateInputs[gate]
+        out = gateOutputs[gate][0]
+        netOnes[out], netUnknowns[out] = gates[gate].bit_logic(
+            [netOnes[net] for net in inputs],
+            [netUnknowns[net] for net in inputs],
+            mask)
+    return netOnes, netUnknowns
+
+
+def simulate_vectors(netlist, vectors):
+    """Return the output values of a combinational netlist for each input
+    vector, in the order of netlist.outputs.
+    """
+    width = len(vectors)
+    ones, unknowns = pack_vectors(vectors, len(netlist.inputs))
+    netOnes, netUnknowns = evaluate_planes(netlist, ones, unknowns, width)
+    columns = [
+        unpack_plane(netOnes[net], netUnknowns[net], width)
+        for net in netlist.outputs]
+    return list(zip(*columns))
@@ -18,7 +18,7 @@
 ###############################################################################
 
 
-from .simulator import *
+from .gates import *
 
 
 class Mem1b(Circuit):
@@ -43,6 +43,8 @@ class Mem1b(Circuit):
 
 class RSFlipFlop(Circuit):
     delay = 10
+    sequential = True
+    __slots__ = ('R', 'S', 'Q', 'NQ')
 
     def __init__(self, name, owner, category=None):
         Circuit.__init__(self, name, owner)
@@ -53,22 +55,38 @@ class RSFlipFlop(Circuit):
         self.init_inputs()
 
     def evalfun(self):
+        outputs, state = self.logic(
+            [inp.value for inp in self.inputList],
+            [out.value for out in self.outputList], ())
+        if outputs is not None:
+            self.schedule(self.Q, outputs[0])
+            self.schedule(self.NQ, outputs[1])
+
+    @staticmethod
+    def logic(values, outputs, state):
+        """Return the values of Q and NQ for the values of R and S, or None
+        when R and S are True: the outputs hold, nothing is scheduled which
+        could undo a change still on its way, unless the outputs are not
+        set yet (NQ is not the opposite of Q). The state is empty.
+        """
+        R, S = values
         valQ = None
         valNQ = None
-        if self.S.value is False and self.R.value is True:
+        if S is False and R is True:
             valQ = True
             valNQ = not valQ
-        if self.S.value is True and self.R.value is False:
+        if S is True and R is False:
             valQ = False
             valNQ = not valQ
-        if self.S.value is False and self.R.value is False:
+        if S is False and R is False:
             valQ = None
             valNQ = None
-        if self.S.value is True and self.R.value is True:
-            valQ = self.Q.value
-            valNQ = self.NQ.value
-        agenda_.schedule(self, lambda: self.Q.set(valQ))
-        agenda_.schedule(self, lambda: self.NQ.set(valNQ))
+        if S is True and R is True:
+            Q, NQ = outputs
+            if Q is None or NQ == (not Q):
+                return None, state
+            return (Q, not Q), state
+        return (valQ, valNQ), state
 
 
 class DFlipFlop(Circuit):
@@ -99,6 +117,9 @@ class DFlipFlop(Circuit):
 
 class JKFlipFlop(Circuit):
     delay = 42
+    sequential = True
+    stateNames = ('prevClock',)
+    __slots__ = ('J', 'K', 'CLK', 'Q', 'NQ', 'prevClock')
 
     def __init__(self, name, owner, category=None):
         Circuit.__init__(self, name, owner)
@@ -111,25 +132,42 @@ class JKFlipFlop(Circuit):
         self.init_inputs()
 
     def evalfun(self):
-        valQ = self.Q.value
+        outputs, (self.prevClock,) = self.logic(
+            [inp.value for inp in self.inputList],
+            [out.value for out in self.outputList], (self.prevClock,))
+        if outputs is not None:
+            self.schedule(self.Q, outputs[0])
+            self.schedule(self.NQ, outputs[1])
+
+    @staticmethod
+    def logic(values, outputs, state):
+        """Return the values of Q and NQ for the values of J, K and CLK,
+        the current values of Q and NQ and the state (the previous clock,
+        for edges), with the new state. Without a clock edge the outputs
+        hold: they are None, nothing is scheduled which could undo a change
+        still on its way, unless the outputs are not set yet (NQ is not the
+        opposite of Q).
+        """
+        J, K, CLK = values
+        Q, NQ = outputs
+        prevClock, = state
+        if CLK == prevClock and NQ == (not Q):
+            return None, state
+        valQ = Q
         valNQ = not valQ
-        if (not self.CLK.value and self.prevClock and self.J.value is True and
-            self.K.value is True):
+        if (not CLK and prevClock and J is True and K is True):
                 #~ print('case 1')
-                valQ = not self.Q.value
+                valQ = not Q
                 valNQ = not valQ
-        if self.J.value is False and self.K.value is False:
+        if J is False and K is False:
             #~ print('case 2')
-            valQ = self.Q.value
+            valQ = Q
             valNQ = not valQ
-        if (self.CLK.value and not self.prevClock and
-            self.J.value != self.K.value):
+        if (CLK and not prevClock and J != K):
                 #~ print('case 3')
-                valQ = self.J.value
+                valQ = J
                 valNQ = not valQ
-        self.prevClock = self.CLK.value
-        agenda_.schedule(self, lambda: self.Q.set(valQ))
-        agenda_.schedule(self, lambda: self.NQ.set(valNQ))
+        return (valQ, valNQ), (CLK,)
 
 
 class Counter4b(Circuit):
@@ -157,15 +195,15 @@ class Counter4b(Circuit):
         self.CLK.connect(self.JKFF1.CLK)
         self.CLK.connect(self.JKFF2.CLK)
         self.CLK.connect(self.JKFF3.CLK)
-        self.JKFF0.NQ.connect(self.JKFF1.J)
-        self.JKFF0.NQ.connect(self.JKFF1.K)
-        self.JKFF0.NQ.connect(self.AND0.inputList[0])
-        self.JKFF0.NQ.connect(self.AND1.inputList[0])
+        self.JKFF0.Q.connect(self.JKFF1.J)
+        self.JKFF0.Q.connect(self.JKFF1.K)
+        self.JKFF0.Q.connect(self.AND0.inputList[0])
+        self.JKFF0.Q.connect(self.AND1.inputList[0])
         self.JKFF0.Q.connect(self.Q0)
-        self.JKFF1.NQ.connect(self.AND0.inputList[1])
-        self.JKFF1.NQ.connect(self.AND1.inputList[1])
+        self.JKFF1.Q.connect(self.AND0.inputList[1])
+        self.JKFF1.Q.connect(self.AND1.inputList[1])
         self.JKFF1.Q.connect(self.Q1)
-        self.JKFF2.NQ.connect(self.AND1.inputList[2])
+        self.JKFF2.Q.connect(self.AND1.inputList[2])
         self.JKFF2.Q.connect(self.Q2)
         self.JKFF3.Q.connect(self.Q3)
         self.AND0.outputList[0].connect(self.JKFF2.J)
@@ -15,46 +15,177 @@
 # This plug is an input whose value changes at regular intervals.             #
 # It's easy to connect this input to inputs so that they force the evaluation #
 # of the circuit at each clock tick.                                          #
+# The VirtualClock rather toggles it in simulated time: its edges are events  #
+# of the Agenda, run as fast as possible by Simulation.run(). A simulation    #
+# can have several clocks, with their own period and phase, all run by one   #
+# ClockThread which follows the real time.                                    #
 ###############################################################################
 
 
-from threading import Thread
+from threading import Condition, Thread
+from weakref import WeakKeyDictionary
 from .simulator import Plug
 import time
 
 
+# The ClockThread of each Simulation.
+clockThreads = WeakKeyDictionary()
+
+
+def clock_thread(simulation):
+    """Return the ClockThread of a simulation, started paused the first
+    time.
+    """
+    thread = clockThreads.get(simulation)
+    if thread is None:
+        thread = clockThreads[simulation] = ClockThread(simulation)
+        thread.paused = True
+        thread.start()
+    return thread
+
+
+def stop_clocks(simulation):
+    """Stop the ClockThread and forget the clocks of a simulation."""
+    thread = clockThreads.pop(simulation, None)
+    if thread is not None:
+        thread.stop()
+    with simulation.lock:
+        for clock in simulation.clocks:
+            clock.stop()
+        simulation.clocks = []
+
+
 class Clock(Plug):
-    """A clock-ready Plug."""
-    def __init__(self, owner):
+    """A clock-ready Plug, toggled by a VirtualClock. The clocks of a
+    simulation share its ClockThread, clkThread.
+    """
+    def __init__(self, owner, period=400, dutyCycle=0.5, phase=0):
         Plug.__init__(self, True, None, owner)
-        self.clkThread = ClockThread(self)
-        self.clkThread.start()
-        self.clkThread.pause()
+        self.virtualClock = VirtualClock(self, period, dutyCycle, phase)
+        self.clkThread = clock_thread(owner.simulation)
+        if not self.clkThread.paused:
+            with owner.simulation.lock:
+                self.virtualClock.start()
+
+
+class VirtualClock:
+    """Toggle a plug in simulated time: a rising edge every period time
+    units, the plug staying True for dutyCycle of the period. The edges are
+    events of the Agenda of the plug's simulation; each one schedules the
+    next. Simulation.run(until) runs them with the events of the circuit,
+    as fast as possible: to follow the real time, run up to the simulated
+    time matching the wall clock. An unstable loop stops the clock.
+    Each half period must be longer than the circuit takes to settle.
+    Several clocks share the agenda of a simulation: their edges are run in
+    the order of their times, phase delaying the first rising edge.
+    """
+    def __init__(self, plug, period=400, dutyCycle=0.5, phase=0):
+        """plug is the Plug toggled by the clock."""
+        self.plug = plug
+        self.simulation = plug.owner.simulation
+        self.period = period
+        """highTime is the time the plug stays True in each period."""
+        self.highTime = min(period - 1, max(1, round(period * dutyCycle)))
+        self.phase = phase
+        self.running = False
+        """nextEdge is the time of the edge event the clock waits for."""
+        self.nextEdge = None
+        """nbCycles counts the rising edges."""
+        self.nbCycles = 0
+        self.simulation.clocks.append(self)
+
+    def start(self):
+        """Start the clock with a rising edge phase time units from now. The
+        time then only advances through Simulation.run().
+        """
+        if self.running:
+            return
+        agenda = self.simulation.agenda
+        self.running = True
+        if agenda.horizon is None:
+            agenda.horizon = agenda.currentTime
+        self.nextEdge = agenda.currentTime + self.phase
+        agenda.add_segment(self.nextEdge, self, True)
+
+    def stop(self):
+        """Stop the clock. Without clock, the events are run at once again.
+        """
+        self.running = False
+        if not any([clock.running for clock in self.simulation.clocks]):
+            self.simulation.agenda.horizon = None
+
+    def do_set(self, value):
+        """Run an edge event: schedule the next edge, then set the plug."""
+        agenda = self.simulation.agenda
+        # stopped, or an edge scheduled before the clock was restarted
+        if not self.running or agenda.currentTime != self.nextEdge:
+            return
+        self.nextEdge = agenda.currentTime + (
+            self.highTime if value else self.period - self.highTime)
+        agenda.add_segment(self.nextEdge, self, not value)
+        if value:
+            self.nbCycles += 1
+        self.simulation.reset_stability()     # each edge starts a settle
+        self.plug.do_set(value)
+
+    def run(self, cycles):
+        """Start the clock if needed and run cycles clock periods."""
+        self.start()
+        self.simulation.run(
+            self.simulation.agenda.currentTime + cycles * self.period - 1)
 
 
 class ClockThread(Thread):
-    """Launch this thread to simulate the clock.
-    Use .connect([Plugs]) to connect the clock to other Plugs.
+    """Launch this thread to run the clocks of a simulation in real time:
+    at each tick it runs step units of simulated time.
+    The thread sleeps on a Condition between two ticks and while it is
+    paused, pause(), unpause(), stop() and setSpeed() wake it up. The
+    simulation is run holding its lock, like the changes made by the
+    GUI. While the thread is paused its clocks are stopped.
     """
-    def __init__(self, clockPlug):
+    spd = 1             # time between two ticks (sec), see the [Clock] settings
+    minPeriod = 0.01    # shortest time between two ticks (sec)
+    step = 200          # simulated time run at each tick: half a clock period
+
+    def __init__(self, simulation):
         Thread.__init__(self)
-        self.clock = clockPlug     # clock plug
+        self.daemon = True
+        self.simulation = simulation
         self.alive = True          # the clock is running
         self.paused = False        # you can pause the clock
-        self.spd = 1               # clock speed (sec)
         self.externFun = None
+        self.wakeUp = Condition()  # notified when the above change
+        self.until = 0             # simulated time reached by the last tick
 
     def run(self):
         """Simulate the job of the clock.
         Allowing you to pause, unpause it and change its speed.
         """
-        while self.alive:
-            while self.paused:
-                time.sleep(0.5)
-            self.clock.set(not self.clock.value)
+        while self.wait_tick():
+            with self.simulation.lock:
+                self.until = max(
+                    self.until, self.simulation.agenda.currentTime) + self.step
+                self.simulation.run(self.until)
             if self.externFun:
                 self.externFun()
-            time.sleep(self.spd)
+
+    def wait_tick(self):
+        """Wait for the time of the next tick, at least minPeriod even with
+        a null speed, and as long as the clock is paused. Return False if
+        the clock is stopped meanwhile.
+        """
+        with self.wakeUp:
+            tick = time.monotonic() + max(self.spd, self.minPeriod)
+            while self.alive:
+                if self.paused:
+                    self.wakeUp.wait()
+                    tick = time.monotonic() + max(self.spd, self.minPeriod)
+                    continue
+                remaining = tick - time.monotonic()
+                if remaining <= 0:
+                    return True
+                self.wakeUp.wait(remaining)
+            return False
 
     def set_extern(self, fun):
         """Set an external function to be run at each clock tic."""
@@ -62,16 +193,32 @@ class ClockThread(Thread):
 
     def pause(self):
         """Pause the clock."""
-        self.paused = True
+        with self.wakeUp:
+            self.paused = True
+            self.wakeUp.notify()
+        with self.simulation.lock:
+            for clock in self.simulation.clocks:
+                clock.stop()
 
     def unpause(self):
         """Unpause the clock."""
-        self.paused = False
+        with self.simulation.lock:
+            for clock in self.simulation.clocks:
+                clock.start()
+            self.until = self.simulation.agenda.currentTime
+            self.simulation.run(self.until)     # the edges starting now
+        with self.wakeUp:
+            self.paused = False
+            self.wakeUp.notify()
 
     def stop(self):
         """Stop the clock."""
-        self.alive = False
+        with self.wakeUp:
+            self.alive = False
+            self.wakeUp.notify()
 
     def setSpeed(self, sec):
         """Set the clock speed (sec)."""
-        self.spd = sec
+        with self.wakeUp:
+            self.spd = sec
+            self.wakeUp.notify()
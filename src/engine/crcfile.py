@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+
+###############################################################################
+#         ╔╦╗┌─┐┌─┐┬┌─┐  ╔═╗┬┬─┐┌─┐┬ ┬┬┌┬┐  ╔═╗┬┌┬┐┬ ┬┬  ┌─┐┌┬┐┌─┐┬─┐         #
+#         ║║║├─┤│ ┬││    ║  │├┬┘│  │ ││ │   ╚═╗│││││ ││  ├─┤ │ │ │├┬┘         #
+#         ╩ ╩┴ ┴└─┘┴└─┘  ╚═╝┴┴└─└─┘└─┘┴ ┴   ╚═╝┴┴ ┴└─┘┴─┘┴ ┴ ┴ └─┘┴└─         #
+# -+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+- #
+#                                                                        2014 #
+#                                                           Sébastien MAGNIEN #
+#                                                            Mathieu FOURCROY #
+# --------------------------------------------------------------------------- #
+# Load the user circuits (.crc files) without the GUI. A .crc file is a       #
+# pickled list of [component, position, rotation]: the positions are Qt       #
+# objects, which are not needed to simulate the circuit.                      #
+###############################################################################
+
+
+from os.path import basename
+import pickle
+from .simulator import Circuit, Plug
+
+
+class CrcUnpickler(pickle.Unpickler):
+    """Unpickle a .crc file, replacing the Qt objects by None."""
+    def find_class(self, module, name):
+        if module.startswith('PySide'):
+            return lambda *args: None
+        return pickle.Unpickler.find_class(self, module, name)
+
+
+def load_circuit(fileName, owner=None):
+    """Return the user circuit saved in fileName, as MainView does when it
+    is dropped on a view.
+    """
+    name = basename(fileName)
+    name = name[:-4] if name.endswith('.crc') else name
+    circuit = Circuit(name, owner, name)
+    f = open(fileName, 'rb')
+    children = CrcUnpickler(f).load()
+    f.close()
+    for child in children:
+        if isinstance(child[0], Plug) or isinstance(child[0], Circuit):
+            circuit.add(child[0])
+    return circuit
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+
+###############################################################################
+#         ╔╦╗┌─┐┌─┐┬┌─┐  ╔═╗┬┬─┐┌─┐┬ ┬┬┌┬┐  ╔═╗┬┌┬┐┬ ┬┬  ┌─┐┌┬┐┌─┐┬─┐         #
+#         ║║║├─┤│ ┬││    ║  │├┬┘│  │ ││ │   ╚═╗│││││ ││  ├─┤ │ │ │├┬┘         #
+#         ╩ ╩┴ ┴└─┘┴└─┘  ╚═╝┴┴└─└─┘└─┘┴ ┴   ╚═╝┴┴ ┴└─┘┴─┘┴ ┴ ┴ └─┘┴└─         #
+# -+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+- #
+#                                                                        2014 #
+#                                                           Sébastien MAGNIEN #
+#                                                            Mathieu FOURCROY #
+# --------------------------------------------------------------------------- #
+# Cycle-based simulation of synchronous circuits. The sequential gates (the   #
+# flip-flops) hold the state, the other gates are evaluated once per clock    #
+# edge in levelized order, without delays. At each edge every flip-flop reads #
+# the values of before the edge, then all their outputs change at once.       #
+###############################################################################
+
+
+from .netlist import Netlist
+
+
+class CycleSimulator:
+    """Simulate a synchronous circuit clock edge by clock edge, on its
+    netlist. The clock is a plug of the circuit, the gates between the
+    flip-flops must not form a loop. The state of the flip-flops is kept
+    by the netlist, see Netlist.evaluate().
+    """
+    def __init__(self, circuit, clock):
+        """clock is the plug driving the flip-flops."""
+        self.netlist = Netlist(circuit)
+        self.clock = self.netlist.net(clock)
+        """registers are the sequential gates, ranks the others in order."""
+        self.registers = [
+            gate for gate, circuit in enumerate(self.netlist.gates)
+            if circuit.sequential]
+        self.ranks = self.netlist.rank_gates(
+            gate for gate, circuit in enumerate(self.netlist.gates)
+            if not circuit.sequential)
+        if self.ranks is False:
+            raise ValueError(
+                "%s has a combinational loop, it can't be simulated by cycles."
+                % (circuit.name,))
+        """logic are the (logic, input nets, output net) of the gates in
+        ranks, registerOutputs the (gate, output nets) of the registers, to
+        be walked quickly."""
+        gates = self.netlist.gates
+        self.logic = [
+            (gates[gate].logic, self.netlist.gateInputs[gate],
+                self.netlist.gateOutputs[gate][0])
+            for gate in self.ranks]
+        self.registerOutputs = [
+            (gate, self.netlist.gateOutputs[gate]) for gate in self.registers]
+        """nbCycles counts the clock cycles, nbEdges the clock edges."""
+        self.nbCycles = 0
+        self.nbEdges = 0
+
+    def evaluate_logic(self):
+        """Evaluate the combinational gates in rank order."""
+        values = self.netlist.values
+        for logic, inputs, output in self.logic:
+            values[output] = logic([values[net] for net in inputs])
+
+    def set(self, plug, value):
+        """Set the value of an input plug and update the logic it drives.
+        The flip-flops only read it at the next clock edge.
+        """
+        self.netlist.values[self.netlist.net(plug)] = value
+        self.evaluate_logic()
+
+    def edge(self, value):
+        """Set the clock to value and update the flip-flops at once. Latches
+        may let their new outputs through to other flip-flops: they are
+        evaluated again until nothing changes. Return False if they don't
+        settle, their outputs are then set to None.
+        """
+        values = self.netlist.values
+        evaluate = self.netlist.evaluate
+        values[self.clock] = value
+        self.nbEdges += 1
+        self.evaluate_logic()
+        for i in range(self.netlist.oscillationLimit):
+            updates = [
+                (outputs, evaluate(gate))
+                for gate, outputs in self.registerOutputs]
+            changed = []
+            for outputs, outputValues in updates:
+                if outputValues is None:    # holds
+                    continue
+                for net, outputValue in zip(outputs, outputValues):
+                    if values[net] != outputValue:
+                        values[net] = outputValue
+                        changed.append(net)
+            if not changed:
+                return True
+            self.evaluate_logic()
+        for net in changed:
+            values[net] = None
+        self.evaluate_logic()
+        return False
+
+    def cycle(self):
+        """Run one clock cycle: a rising edge then a falling edge."""
+        self.edge(True)
+        self.edge(False)
+        self.nbCycles += 1
+
+    def run(self, cycles):
+        """Run several clock cycles."""
+        for i in range(cycles):
+            self.cycle()
+
+    def value(self, plug):
+        """Return the value of a plug's net."""
+        return self.netlist.values[self.netlist.net(plug)]
+
+    def update_plugs(self):
+        """Copy the value of every net to the plugs of the circuit."""
+        self.netlist.update_plugs()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+
+###############################################################################
+#         ╔╦╗┌─┐┌─┐┬┌─┐  ╔═╗┬┬─┐┌─┐┬ ┬┬┌┬┐  ╔═╗┬┌┬┐┬ ┬┬  ┌─┐┌┬┐┌─┐┬─┐         #
+#         ║║║├─┤│ ┬││    ║  │├┬┘│  │ ││ │   ╚═╗│││││ ││  ├─┤ │ │ │├┬┘         #
+#         ╩ ╩┴ ┴└─┘┴└─┘  ╚═╝┴┴└─└─┘└─┘┴ ┴   ╚═╝┴┴ ┴└─┘┴─┘┴ ┴ ┴ └─┘┴└─         #
+# -+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+- #
+#                                                                        2014 #
+#                                                           Sébastien MAGNIEN #
+#                                                            Mathieu FOURCROY #
+# --------------------------------------------------------------------------- #
+# Stuck-at fault simulation. A fault holds a Plug at True or False: the gate  #
+# inputs and circuit outputs downstream of the plug are moved to a constant   #
+# net of a copy of the netlist. Combinational circuits are checked against    #
+# all the vectors at once with the bit-parallel evaluator, the others are run #
+# vector by vector on the event-driven netlist, the faults being shared out   #
+# between processes.                                                          #
+###############################################################################
+
+
+from copy import copy
+from multiprocessing import Pool
+from .bitparallel import evaluate_planes, pack_vectors
+from .netlist import Netlist
+
+
+def fault_name(fault):
+    """Return a readable name for a (plug, value) fault."""
+    plug, value = fault
+    return '%s.%s/%i' % (plug.owner.name, plug.name, value)
+
+
+def fault_sites(netlist, gateIndexes, plug):
+    """Return the (gate, input) pins and the circuit outputs which are
+    downstream of a plug. gateIndexes maps the gates to their index.
+    """
+    pins = []
+    outputs = []
+    pending = [plug]
+    while pending:
+        member = pending.pop()
+        pending.extend(member.destinationPlugs)
+        if not member.isInput:
+            if member in netlist.circuit.outputList:
+                outputs.append(netlist.circuit.outputList.index(member))
+        elif member.owner in gateIndexes:
+            pins.append((
+                gateIndexes[member.owner],
+                member.owner.inputList.index(member)))
+    return tuple(sorted(pins)), tuple(sorted(outputs))
+
+
+def faulty_netlist(netlist, initialValues, initialStates, sites=None,
+        value=None):
+    """Return a copy of netlist, with the initialValues and the
+    initialStates of its sequential gates, in which the pins and outputs of
+    the sites are stuck at value. Without sites the copy is the good
+    circuit.
+    """
+    faulty = copy(netlist)
+    faulty.values = list(initialValues)
+    faulty.states = list(initialStates)
+    if sites is None:
+        return faulty
+    pins, outputs = sites
+    stuck = len(initialValues)
+    faulty.values.append(value)
+    faulty.fanout = [list(readers) for readers in netlist.fanout] + [[]]
+    faulty.gateInputs = list(netlist.gateInputs)
+    faulty.outputs = list(netlist.outputs)
+    for output in outputs:
+        faulty.outputs[output] = stuck
+    for gate, pin in pins:
+        inputs = list(faulty.gateInputs[gate])
+        net = inputs[pin]
+        inputs[pin] = stuck
+        faulty.gateInputs[gate] = tuple(inputs)
+        if net not in inputs and gate in faulty.fanout[net]:
+            faulty.fanout[net].remove(gate)
+        if gate not in faulty.fanout[stuck]:
+            faulty.fanout[stuck].append(gate)
+    return faulty
+
+
+class FaultSimulator:
+    """Simulate the stuck-at-0 and stuck-at-1 faults of every Plug of a
+    circuit against a list of input vectors (tuples of values in the order
+    of the circuit inputList). A fault is detected when an output is True
+    or False in the good circuit and the opposite in the faulty one.
+    The faults of plugs with the same sites (e.g. the plugs chained through
+    sub-circuit boundaries) are equivalent and simulated once.
+    """
+    def __init__(self, circuit):
+        self.netlist = Netlist(circuit)
+        gateIndexes = dict(
+            [(gate, i) for i, gate in enumerate(self.netlist.gates)])
+        if not self.netlist.is_combinational():
+            self.netlist.settle()
+        self.initialValues = list(self.netlist.values)
+        self.initialStates = list(self.netlist.states)
+        """faults are the (plug, value) pairs, in the order of the nets."""
+        self.faults = []
+        """classes are the (sites, value) of the faults, simulated once."""
+        self.classes = []
+        self.faultClasses = []
+        classIndexes = {}
+        for plugs in self.netlist.netPlugs:
+            for plug in plugs:
+                sites = fault_sites(self.netlist, gateIndexes, plug)
+                for value in (False, True):
+                    if (sites, value) not in classIndexes:
+                        classIndexes[(sites, value)] = len(self.classes)
+                        self.classes.append((sites, value))
+                    self.faults.append((plug, value))
+                    self.faultClasses.append(classIndexes[(sites, value)])
+
+    def run(self, vectors, processes=None):
+        """Simulate every fault, return a report: the number of faults,
+        the coverage and the detected and undetected faults.
+        """
+        if self.netlist.is_combinational():
+            detected = self.run_parallel_patterns(vectors)
+        elif processes == 1:
+            good = self.run_sequential(None, vectors)
+            detected = [
+                self.detect_sequential(faultClass, vectors, good)
+                for faultClass in self.classes]
+        else:
+            pool = Pool(processes, init_worker, (self, vectors))
+            detected = pool.map(detect_in_worker, range(len(self.classes)))
+            pool.close()
+            pool.join()
+        report = {'faults': len(self.faults), 'detected': [],
+            'undetected': []}
+        for fault, faultClass in zip(self.faults, self.faultClasses):
+            report['detected' if detected[faultClass] else 'undetected'
+                ].append(fault)
+        report['coverage'] = (
+            len(report['detected']) / len(self.faults) if self.faults else 1)
+        return report
+
+    def run_parallel_patterns(self, vectors):
+        """Evaluate each faulty netlist for all the vectors at once, return
+        whether each fault is detected.
+        """
+        width = len(vectors)
+        ones, unknowns = pack_vectors(vectors, len(self.netlist.inputs))
+        goodOnes, goodUnknowns = evaluate_planes(
+            self.netlist, ones, unknowns, width)
+        good = [(goodOnes[net], goodUnknowns[net])
+            for net in self.netlist.outputs]
+        detected = []
+        for sites, value in self.classes:
+            faulty = faulty_netlist(
+                self.netlist, self.initialValues, self.initialStates, sites,
+                value)
+            netOnes, netUnknowns = evaluate_planes(
+                faulty, ones, unknowns, width)
+            differences = 0
+            for net, (one, unknown) in zip(faulty.outputs, good):
+                differences |= (
+                    (netOnes[net] ^ one) & ~(netUnknowns[net] | unknown))
+            detected.append(differences != 0)
+        return detected
+
+    def run_sequential(self, faultClass, vectors):
+        """Apply the vectors in sequence to the netlist with a fault class
+        (or to the good one if faultClass is None), return the outputs after
+        each one.
+        """
+        netlist = faulty_netlist(
+            self.netlist, self.initialValues, self.initialStates,
+            *(faultClass if faultClass else ()))
+        netlist.settle()
+        values = netlist.values
+        outputs = []
+        for vector in vectors:
+            netlist.set_nets(list(zip(netlist.inputs, vector)))
+            outputs.append([values[net] for net in netlist.outputs])
+        return outputs
+
+    def detect_sequential(self, faultClass, vectors, good):
+        """Return True if the outputs of the faulty netlist differ from the
+        good outputs for some vector.
+        """
+        for goodValues, faultyValues in zip(
+                good, self.run_sequential(faultClass, vectors)):
+            for goodValue, faultyValue in zip(goodValues, faultyValues):
+                if (goodValue is not None and faultyValue is not None
+                        and bool(goodValue) != bool(faultyValue)):
+                    return True
+        return False
+
+
+def init_worker(simulator, vectors):
+    """Keep the simulator, the vectors and the good outputs in a worker
+    process.
+    """
+    global workerSimulator, workerVectors, workerGood
+    workerSimulator = simulator
+    workerVectors = vectors
+    workerGood = simulator.run_sequential(None, vectors)
+
+
+def detect_in_worker(index):
+    """Simulate a fault in a worker process."""
+    return workerSimulator.detect_sequential(
+        workerSimulator.classes[index], workerVectors, workerGood)
@@ -13,18 +13,83 @@
 # --------------------------------------------------------------------------- #
 # Builtin gates. Unlike user circuits, their evalfun() is implemented.        #
 # For scheduling: we compute the output value at present time and schedule    #
-# the change.                                                                 #
+# the change. The output value is read in a truth table over the three values #
+# coded as 0 (False), 1 (True) and 2 (None), built once per gate type and     #
+# number of inputs. AND, OR, NAND and NOR gates of any width rather keep the  #
+# counts of their False, True and None inputs, updated when one input changes.#
 # --------------------------------------------------------------------------- #
 # TODO: increase delay when more than two inputs                              #
 ###############################################################################
 
 
+from itertools import product
 from .simulator import *
 
 
+# The code of each value in the truth tables. 0 and 1 are False and True.
+CODES = {False: 0, True: 1, None: 2}
+# Wider gates use their logic(), the table would have 3 ** inputs values.
+TABLE_MAX_INPUTS = 4
+tables = {}
+
+
+def gate_table(gateClass, nbInputs):
+    """Return the truth table of a gate type for nbInputs inputs, or None
+    if it has too many inputs. The value of inputs coded c0, c1... cn is at
+    index ((c0 * 3) + c1) * 3 ... + cn.
+    """
+    key = (gateClass, nbInputs)
+    if key not in tables:
+        tables[key] = None if nbInputs > TABLE_MAX_INPUTS else [
+            gateClass.logic(list(values))
+            for values in product((False, True, None), repeat=nbInputs)]
+    return tables[key]
+
+
+def lookup(gate):
+    """Return the output value of a gate for the values of its inputs."""
+    inputs = gate.inputList
+    table = tables.get((gate.__class__, len(inputs)), False)
+    if table is False:
+        table = gate_table(gate.__class__, len(inputs))
+    if table is None:
+        return gate.logic([inp.value for inp in inputs])
+    index = 0
+    codes = CODES
+    for inp in inputs:
+        index = index * 3 + codes[inp.value]
+    return table[index]
+
+
+def count_inputs(gate):
+    """Count the False, True and None inputs of a gate, in the order of
+    their CODES, and keep the counts in gate.counts.
+    """
+    counts = [0, 0, 0]
+    for inp in gate.inputList:
+        counts[CODES[inp.value]] += 1
+    gate.counts = counts
+    return counts
+
+
+def input_counts(gate, previous, value):
+    """Return the counts of the inputs of a gate after one of them changed
+    from previous to value. They are counted again if they are unknown:
+    adding or removing an input calls refresh_inputs() which forgets them.
+    """
+    counts = gate.counts
+    if counts is None:
+        return count_inputs(gate)
+    counts[CODES[previous]] -= 1
+    counts[CODES[value]] += 1
+    return counts
+
+
 class NotGate(Circuit):
     """One input only. Output == not Input."""
     delay = 2
+    inertial = True
+    __slots__ = ()
 
     def __init__(self, name, owner, category=None):
         Circuit.__init__(self, name, owner)
@@ -33,100 +98,197 @@ class NotGate(Circuit):
         self.init_inputs()
 
     def evalfun(self):
-        val = not self.inputList[0].value
-        if self.inputList[0].value is None:
-            val = None
-        agenda_.schedule(self, lambda: self.outputList[0].set(val))
+        self.schedule(self.outputList[0], lookup(self))
 
+    @staticmethod
+    def logic(values):
+        """Return the output value for the input values."""
+        if values[0] is None:
+            return None
+        return not values[0]
+
+    @staticmethod
+    def bit_logic(ones, unknowns, mask):
+        """Return the output planes for the input planes, see bitparallel."""
+        return ~(ones[0] | unknowns[0]) & mask, unknowns[0]
 
-class AndGate(Circuit):
-    """Any number of inputs. Output false unless every input true."""
-    delay = 3
+
+class CountingGate(Circuit):
+    """The base of the gates with any number of inputs whose output only
+    depends on the counts of their False, True and None inputs, see
+    count_logic(). The counts are updated when one input changes.
+    """
+    inertial = True
+    __slots__ = ('counts',)
 
     def __init__(self, name, owner, inputs=2):
         Circuit.__init__(self, name, owner)
+        """counts are the numbers of False, True and None inputs."""
+        self.counts = None
         for i in range(inputs):
             Plug(True, None, self)
         Plug(False, None, self)
         self.init_inputs()
 
+    def __setstate__(self, state):
+        Circuit.__setstate__(self, state)
+        self.counts = None
+
     def evalfun(self):
-        val = all([inp.value for inp in self.inputList])
-        for inp in self.inputList:
-            if inp.value is None and val:
-                val = None
-        agenda_.schedule(self, lambda: self.outputList[0].set(val))
+        self.schedule(
+            self.outputList[0], self.count_logic(count_inputs(self)))
 
+    def input_changed(self, previous, value):
+        self.schedule(
+            self.outputList[0],
+            self.count_logic(input_counts(self, previous, value)))
 
-class NandGate(Circuit):
-    """Any number of inputs. Output true unless every input true."""
-    delay = 5
+    def refresh_inputs(self):
+        self.counts = None
 
-    def __init__(self, name, owner, inputs=2):
-        Circuit.__init__(self, name, owner)
-        for i in range(inputs):
-            Plug(True, None, self)
-        Plug(False, None, self)
-        self.init_inputs()
 
-    def evalfun(self):
-        val = not all([inp.value for inp in self.inputList])
-        for inp in self.inputList:
-            if inp.value is None:
-                for inp2 in self.inputList:
-                    if inp2.value is False:
+class AndGate(CountingGate):
+    """Any number of inputs. Output false unless every input true."""
+    delay = 3
+    __slots__ = ()
+
+    @staticmethod
+    def count_logic(counts):
+        """Return the output value for the counts of the input values."""
+        nbFalse, nbTrue, nbNone = counts
+        return nbFalse + nbNone == 0
+
+    @staticmethod
+    def logic(values):
+        """Return the output value for the input values."""
+        val = all(values)
+        if val and None in values:
+            val = None
+        return val
+
+    @staticmethod
+    def bit_logic(ones, unknowns, mask):
+        """Return the output planes for the input planes, see bitparallel."""
+        out = mask
+        for one in ones:
+            out &= one
+        return out, 0
+
+
+class NandGate(CountingGate):
+    """Any number of inputs. Output true unless every input true."""
+    delay = 5
+    __slots__ = ()
+
+    @staticmethod
+    def count_logic(counts):
+        """Return the output value for the counts of the input values."""
+        nbFalse, nbTrue, nbNone = counts
+        if nbNone == 1 and nbFalse == 0:
+            return None
+        return nbFalse + nbNone > 0
+
+    @staticmethod
+    def logic(values):
+        """Return the output value for the input values."""
+        val = not all(values)
+        for i, value in enumerate(values):
+            if value is None:
+                for value2 in values:
+                    if value2 is False:
                         val = True
                 t = True
-                for inp2 in self.inputList:
-                    if inp2 is inp:
-                        pass
-                    elif inp2.value is not True:
+                for j, value2 in enumerate(values):
+                    if j != i and value2 is not True:
                         t = False
                 if t:
                     val = None
-        agenda_.schedule(self, lambda: self.outputList[0].set(val))
-
-
-class OrGate(Circuit):
+        return val
+
+    @staticmethod
+    def bit_logic(ones, unknowns, mask):
+        """Return the output planes for the input planes, see bitparallel."""
+        allOnes = mask
+        anyZero = 0
+        oneUnknown = 0
+        twoUnknowns = 0
+        for one, unknown in zip(ones, unknowns):
+            allOnes &= one
+            anyZero |= ~(one | unknown)
+            twoUnknowns |= oneUnknown & unknown
+            oneUnknown |= unknown
+        unknown = oneUnknown & ~twoUnknowns & ~anyZero & mask
+        return ~allOnes & ~unknown & mask, unknown
+
+
+class OrGate(CountingGate):
     """Any number of inputs. Output true unless every input false."""
     delay = 5
+    __slots__ = ()
+
+    @staticmethod
+    def count_logic(counts):
+        """Return the output value for the counts of the input values."""
+        nbFalse, nbTrue, nbNone = counts
+        if nbTrue == 0 and nbNone:
+            return None
+        return nbTrue > 0
+
+    @staticmethod
+    def logic(values):
+        """Return the output value for the input values."""
+        val = any(values)
+        if not val and None in values:
+            val = None
+        return val
 
-    def __init__(self, name, owner, inputs=2):
-        Circuit.__init__(self, name, owner)
-        for i in range(inputs):
-            Plug(True, None, self)
-        Plug(False, None, self)
-        self.init_inputs()
-
-    def evalfun(self):
-        val = any([inp.value for inp in self.inputList])
-        for inp in self.inputList:
-            if inp.value is None and not val:
-                val = None
-        agenda_.schedule(self, lambda: self.outputList[0].set(val))
+    @staticmethod
+    def bit_logic(ones, unknowns, mask):
+        """Return the output planes for the input planes, see bitparallel."""
+        out = 0
+        anyUnknown = 0
+        for one, unknown in zip(ones, unknowns):
+            out |= one
+            anyUnknown |= unknown
+        return out, anyUnknown & ~out
 
 
-class NorGate(Circuit):
+class NorGate(CountingGate):
     """Any number of inputs. Output false unless every input false."""
     delay = 7
+    __slots__ = ()
+
+    @staticmethod
+    def count_logic(counts):
+        """Return the output value for the counts of the input values."""
+        nbFalse, nbTrue, nbNone = counts
+        if nbTrue and nbNone:
+            return None
+        return nbTrue == 0
+
+    @staticmethod
+    def logic(values):
+        """Return the output value for the input values."""
+        val = not any(values)
+        if not val and None in values:
+            val = None
+        return val
 
-    def __init__(self, name, owner, inputs=2):
-        Circuit.__init__(self, name, owner)
-        for i in range(inputs):
-            Plug(True, None, self)
-        Plug(False, None, self)
-        self.init_inputs()
-
-    def evalfun(self):
-        val = not any([inp.value for inp in self.inputList])
-        for inp in self.inputList:
-            if inp.value is None and not val:
-                val = None
-        agenda_.schedule(self, lambda: self.outputList[0].set(val))
+    @staticmethod
+    def bit_logic(ones, unknowns, mask):
+        """Return the output planes for the input planes, see bitparallel."""
+        anyOne = 0
+        anyUnknown = 0
+        for one, unknown in zip(ones, unknowns):
+            anyOne |= one
+            anyUnknown |= unknown
+        return ~anyOne & mask, anyOne & anyUnknown
 
 
 class XorGate(Circuit):
     delay = 15
+    inertial = True
+    __slots__ = ()
 
     def __init__(self, name, owner, inputs=2):
         Circuit.__init__(self, name, owner)
@@ -136,16 +298,26 @@ class XorGate(Circuit):
         self.init_inputs()
 
     def evalfun(self):
-        valuesList = [input.value for input in self.inputList]
-        val = valuesList.count(True) % 2
-        for inp in self.inputList:
-            if inp is None:
-                val = None
-        agenda_.schedule(self, lambda: self.outputList[0].set(val))
+        self.schedule(self.outputList[0], lookup(self))
+
+    @staticmethod
+    def logic(values):
+        """Return the output value for the input values."""
+        return values.count(True) % 2 == 1
+
+    @staticmethod
+    def bit_logic(ones, unknowns, mask):
+        """Return the output planes for the input planes, see bitparallel."""
+        out = 0
+        for one in ones:
+            out ^= one
+        return out, 0
 
 
 class XnorGate(Circuit):
     delay = 15
+    inertial = True
+    __slots__ = ()
 
     def __init__(self, name, owner, inputs=2):
         Circuit.__init__(self, name, owner)
@@ -155,9 +327,19 @@ class XnorGate(Circuit):
         self.init_inputs()
 
     def evalfun(self):
-        valuesList = [inp.value for inp in self.inputList]
-        val = all(valuesList) or not any(valuesList)
-        for inp in self.inputList:
-            if inp is None and val:
-                val = None
-        agenda_.schedule(self, lambda: self.outputList[0].set(val))
+        self.schedule(self.outputList[0], lookup(self))
+
+    @staticmethod
+    def logic(values):
+        """Return the output value for the input values."""
+        return all(values) or not any(values)
+
+    @staticmethod
+    def bit_logic(ones, unknowns, mask):
+        """Return the output planes for the input planes, see bitparallel."""
+        allOnes = mask
+        anyOne = 0
+        for one in ones:
+            allOnes &= one
+            anyOne |= one
+        return (allOnes | ~anyOne) & mask, 0
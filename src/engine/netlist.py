@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+
+###############################################################################
+#         ╔╦╗┌─┐┌─┐┬┌─┐  ╔═╗┬┬─┐┌─┐┬ ┬┬┌┬┐  ╔═╗┬┌┬┐┬ ┬┬  ┌─┐┌┬┐┌─┐┬─┐         #
+#         ║║║├─┤│ ┬││    ║  │├┬┘│  │ ││ │   ╚═╗│││││ ││  ├─┤ │ │ │├┬┘         #
+#         ╩ ╩┴ ┴└─┘┴└─┘  ╚═╝┴┴└─└─┘└─┘┴ ┴   ╚═╝┴┴ ┴└─┘┴─┘┴ ┴ ┴ └─┘┴└─         #
+# -+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+- #
+#                                                                        2014 #
+#                                                           Sébastien MAGNIEN #
+#                                                            Mathieu FOURCROY #
+# --------------------------------------------------------------------------- #
+# Compile a hierarchical Circuit into a flat netlist: the plugs connected     #
+# together form a net, the builtin gates read and drive nets. Nets and gates  #
+# are integers, so the simulation kernels don't walk the Plug objects and the #
+# plugs of the sub-circuits boundaries cost nothing.                          #
+###############################################################################
+
+
+from heapq import heappop, heappush
+from .simulator import Circuit, Simulation
+
+
+class Netlist:
+    """A Circuit compiled to integer-indexed arrays. Nets are numbered in
+    the order their plugs are found, gates in the order of the circuitLists.
+    Its event-driven kernel works like the Agenda (same delays, FIFO order,
+    inertial gates and unstable loops) and update_plugs() copies the values
+    of the nets back to the plugs of the circuit. The netlist keeps its own
+    copy of the state of the sequential gates (their stateNames, e.g.
+    JKFlipFlop.prevClock) and hands it to their logic(): the circuits are
+    left untouched and copies of a netlist run independently.
+    """
+    def __init__(self, circuit):
+        """circuit is the root of the hierarchy to compile."""
+        self.circuit = circuit
+        """oscillationLimit is the one of the simulation of the circuit,
+        kept as a pickled circuit has no simulation."""
+        simulation = circuit.simulation
+        self.oscillationLimit = (
+            simulation if simulation is not None else Simulation
+            ).oscillationLimit
+        """plugNets maps every plug to the index of its net."""
+        self.plugNets = {}
+        """netPlugs lists the plugs of each net."""
+        self.netPlugs = []
+        """values is the value of each net."""
+        self.values = []
+        """fanout lists the gates reading each net."""
+        self.fanout = []
+        """gates are the compiled Circuits, with their nets and delay."""
+        self.gates = []
+        self.gateInputs = []
+        self.gateOutputs = []
+        self.gateDelays = []
+        """states are the values of the stateNames of each gate."""
+        self.states = []
+        self.currentTime = 0
+        self.nbEvents = 0
+        """unstableNets lists the nets of the last unstable loop."""
+        self.unstableNets = []
+        """ranks lists the gates in topological order, see levelize()."""
+        self.ranks = None
+        self.add_circuit(circuit)
+        """inputs and outputs are the nets of the circuit's own plugs."""
+        self.inputs = [self.add_plug(plug) for plug in circuit.inputList]
+        self.outputs = [self.add_plug(plug) for plug in circuit.outputList]
+
+    def add_circuit(self, circuit):
+        """Compile the gates of a circuit and of its sub-circuits."""
+        for sub in circuit.circuitList:
+            if hasattr(sub, 'logic'):
+                self.add_gate(sub)
+            elif sub.circuitList or sub.__class__.evalfun is Circuit.evalfun:
+                self.add_circuit(sub)
+            else:
+                raise ValueError(
+                    "%s '%s' has no logic(), it can't be compiled."
+                    % (sub.class_name(), sub.name,))
+
+    def add_gate(self, gate):
+        """Add a gate and the nets of its plugs."""
+        index = len(self.gates)
+        inputs = tuple(self.add_plug(plug) for plug in gate.inputList)
+        outputs = tuple(self.add_plug(plug) for plug in gate.outputList)
+        self.gates.append(gate)
+        self.gateInputs.append(inputs)
+        self.gateOutputs.append(outputs)
+        self.gateDelays.append(gate.delay)
+        self.states.append(
+            tuple([getattr(gate, name) for name in gate.stateNames]))
+        for net in inputs:
+            if index not in self.fanout[net]:
+                self.fanout[net].append(index)
+
+    def add_plug(self, plug):
+        """Return the net of a plug, numbering its whole net if needed."""
+        if plug in self.plugNets:
+            return self.plugNets[plug]
+        root = plug
+        while root.sourcePlug is not None:
+            root = root.sourcePlug
+        net = len(self.netPlugs)
+        plugs = []
+        pending = [root]
+        while pending:
+            member = pending.pop()
+            self.plugNets[member] = net
+            plugs.append(member)
+            pending.extend(reversed(member.destinationPlugs))
+        self.netPlugs.append(plugs)
+        self.values.append(root.value)
+        self.fanout.append([])
+        return net
+
+    def evaluate(self, gate):
+        """Return the output values of a gate for the values of its nets, or
+        None if a sequential gate holds its outputs.
+        """
+        values = self.values
+        inputs = [values[net] for net in self.gateInputs[gate]]
+        circuit = self.gates[gate]
+        if not circuit.sequential:
+            return (circuit.logic(inputs),)
+        outputs, self.states[gate] = circuit.logic(
+            inputs, [values[net] for net in self.gateOutputs[gate]],
+            self.states[gate])
+        return outputs
+
+    def net(self, plug):
+        """Return the index of the net of a plug."""
+        return self.plugNets[plug]
+
+    def is_combinational(self):
+        """Return True if the netlist has no sequential gate nor loop."""
+        if self.ranks is None:
+            self.levelize()
+        return self.ranks is not False
+
+    def levelize(self):
+        """Sort the gates so that every gate comes after the gates driving
+        its inputs. ranks is set to False if the netlist has a feedback
+        loop or a sequential gate.
+        """
+        if any(gate.sequential for gate in self.gates):
+            self.ranks = False
+            return
+        self.ranks = self.rank_gates(range(len(self.gates)))
+
+    def rank_gates(self, gates):
+        """Return the gates sorted so that every gate comes after those of
+        the gates driving its inputs, or False if they form a loop.
+        """
+        gates = list(gates)
+        nbDrivers = dict.fromkeys(gates, 0)
+        for gate in gates:
+            for net in self.gateOutputs[gate]:
+                for reader in self.fanout[net]:
+                    if reader in nbDrivers:
+                        nbDrivers[reader] += 1
+        ranks = [gate for gate in gates if not nbDrivers[gate]]
+        for gate in ranks:      # ranks grows while it is walked
+            for net in self.gateOutputs[gate]:
+                for reader in self.fanout[net]:
+                    if reader in nbDrivers:
+                        nbDrivers[reader] -= 1
+                        if not nbDrivers[reader]:
+                            ranks.append(reader)
+        return ranks if len(ranks) == len(gates) else False
+
+    def set(self, plug, value, levelized=False):
+        """Set the value of a plug's net and propagate the change."""
+        self.set_nets([(self.plugNets[plug], value)], levelized)
+
+    def set_nets(self, assignments, levelized=False):
+        """Set the (net, value) assignments at once and propagate them. If
+        a loop becomes unstable, the assigned nets are set to None.
+        If levelized is True and the netlist is combinational, every gate
+        is evaluated once in rank order, with no delay, instead.
+        """
+        if levelized and self.is_combinational():
+            self.evaluate_levelized(assignments)
+        elif not self.propagate(assignments):
+            self.propagate([(net, None) for net, value in assignments])
+
+    def evaluate_levelized(self, assignments):
+        """Apply the assignments then evaluate each gate in rank order."""
+        values = self.values
+        gates = self.gates
+        gateInputs = self.gateInputs
+        gateOutputs = self.gateOutputs
+        for net, value in assignments:
+            values[net] = value
+        for gate in self.ranks:
+            values[gateOutputs[gate][0]] = gates[gate].logic(
+                [values[net] for net in gateInputs[gate]])
+
+    def evaluate_combinational(self):
+        """Evaluate the gates which are not sequential once in rank order,
+        with no delay: the sequential gates cut the loops and keep their
+        outputs. Return False, changing nothing, if the other gates form a
+        loop.
+        """
+        ranks = self.rank_gates(
+            gate for gate, circuit in enumerate(self.gates)
+            if not circuit.sequential)
+        if ranks is False:
+            return False
+        values = self.values
+        gates = self.gates
+        gateInputs = self.gateInputs
+        gateOutputs = self.gateOutputs
+        for gate in ranks:
+            values[gateOutputs[gate][0]] = gates[gate].logic(
+                [values[net] for net in gateInputs[gate]])
+        return True
+
+    def settle(self):
+        """Evaluate every gate once and propagate, e.g. after compiling a
+        circuit whose plugs were never set.
+        """
+        events = []
+        for gate in range(len(self.gates)):
+            outputs = self.evaluate(gate)
+            if outputs is not None:
+                events.extend(zip(self.gateOutputs[gate], outputs))
+        self.propagate(events)
+
+    def propagate(self, assignments):
+        """Apply the assignments, then run the gate events until no event
+        remains. Return False if an unstable loop had to be stopped.
+        """
+        values = self.values
+        fanout = self.fanout
+        gates = self.gates
+        gateOutputs = self.gateOutputs
+        gateDelays = self.gateDelays
+        limit = self.oscillationLimit
+        changes = {}
+        pendingEvents = {}
+        queue = []
+        sequenceNb = 0
+        changed = list(assignments)
+        while True:
+            for net, value in changed:
+                if values[net] == value:
+                    continue
+                nb = changes.get(net, 0) + 1
+                changes[net] = nb
+                if nb > limit:
+                    self.unstableNets = sorted(
+                        n for n, nb in changes.items() if nb * 2 > limit)
+                    return False
+                values[net] = value
+                for gate in fanout[net]:
+                    outputs = self.evaluate(gate)
+                    if outputs is None:
+                        continue
+                    time = self.currentTime + gateDelays[gate]
+                    inertial = gates[gate].inertial
+                    for out, val in zip(gateOutputs[gate], outputs):
+                        if inertial:
+                            pendingEvents[out] = sequenceNb
+                        heappush(queue, (time, sequenceNb, out, val, inertial))
+                        sequenceNb += 1
+            if not queue:
+                return True
+            time, seq, net, value, inertial = heappop(queue)
+            self.currentTime = time
+            if inertial:
+                if pendingEvents.get(net) != seq:
+                    changed = ()
+                    continue
+                del pendingEvents[net]
+            self.nbEvents += 1
+            changed = ((net, value),)
+
+    def update_plugs(self):
+        """Copy the value of every net to its plugs and the state of the
+        sequential gates to them. Return the plugs whose value changed.
+        """
+        changed = []
+        for net, plugs in enumerate(self.netPlugs):
+            value = self.values[net]
+            for plug in plugs:
+                if plug.value != value:
+                    plug.value = value
+                    changed.append(plug)
+        for gate, state in zip(self.gates, self.states):
+            for name, value in zip(gate.stateNames, state):
+                setattr(gate, name, value)
+        for gate in self.gates:
+            gate.refresh_inputs()
+        return changed
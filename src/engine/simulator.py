@@ -23,12 +23,18 @@
 import sys
 import time
 from copy import deepcopy
+from os.path import dirname, realpath
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from threading import RLock
+from heapq import heappop, heappush
 import logging
 
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
-fileHandler = logging.FileHandler('simulator.log')
+fileHandler = logging.FileHandler('simulator.log', delay=True)
 stdoutHandler = logging.StreamHandler()
 fileHandler.setLevel(logging.DEBUG)
 stdoutHandler.setLevel(logging.DEBUG)
@@ -38,21 +44,57 @@ fileHandler.setFormatter(formatter)
 stdoutHandler.setFormatter(formatter)
 
 
-recursionNb_ = 0
-gateList_ = []
-exceed_ = False
+def locked(method):
+    """Decorate a method of a Simulation, Circuit or Plug which changes the
+    circuits, to run it holding the lock of their Simulation.
+    """
+    @wraps(method)
+    def lockedMethod(self, *args, **kwargs):
+        if isinstance(self, Simulation):
+            simulation = self
+        elif isinstance(self, Plug):
+            simulation = self.owner.simulation
+        else:
+            simulation = self.simulation
+        with simulation.lock:
+            return method(self, *args, **kwargs)
+    return lockedMethod
+
+
+def load_strings(lang='en'):
+    """The engine log messages are set by the GUI, set them without it."""
+    strFile = dirname(realpath(__file__)) + '/../../lang/strings_' + lang
+    f = open(strFile, 'r')
+    for _, line in enumerate(f):
+        if line.startswith('Plug') or line.startswith('Circuit'):
+            exec(line)
+    f.close()
 
 
 class Agenda:
     """This class handle the propagation of the events. It contain a priority
-    queue of segments wich describe events (delay + operation). Th events
-    are added on the queue so that they're sort from the nearest to the
-    farthest. The agenda can then execute the scheduled events (outputs
-    changes) by propagating them.
+    queue of segments wich describe events (time + plug + value). The queue is
+    a binary heap ordered by execution time, then by a sequence number so
+    that events scheduled for the same time are executed in FIFO order. The
+    agenda can then execute the scheduled events (outputs changes) by
+    propagating them.
+    For the outputs of inertial gates, only the last event scheduled for a
+    plug is run, the pending ones are cancelled (inertial delay): an output
+    does not follow pulses shorter than the delay of its gate.
     """
     def __init__(self):
         self.currentTime = 0
         self.timeSegments = []
+        self.sequenceNb = 0
+        self.propagating = False
+        self.nbEvents = 0
+        """pendingEvents maps a plug to the sequence number of its event."""
+        self.pendingEvents = {}
+        self.nbCancelled = 0
+        """horizon is the time after which propagate() stops, the later
+        events wait for Simulation.run(). With None, every event is run.
+        """
+        self.horizon = None
 
     def is_empty(self):
         """Return True if there is no scheduled action."""
@@ -62,48 +104,465 @@ class Agenda:
         """Return the current time of the agenda."""
         return self.currentTime
 
-    def add_segment(self, time, action, name):
-        """Add a segment and sort the queue from nearest to farthest event."""
-        self.timeSegments.append((time, action, name))
-        self.timeSegments.sort(key=lambda item: item[0])
+    def next_time(self):
+        """Return the time of the nearest segment, the queue not being
+        empty.
+        """
+        return self.timeSegments[0][0]
+
+    def advance(self, time):
+        """Set the current time, e.g. to run the events up to a time."""
+        self.currentTime = time
+
+    def add_segment(self, time, plug, value, inertial=False):
+        """Push a segment on the queue, in O(log n)."""
+        heappush(
+            self.timeSegments, (time, self.sequenceNb, plug, value, inertial))
+        self.sequenceNb += 1
+
+    def clear(self):
+        """Drop every scheduled action."""
+        self.timeSegments = []
+        self.pendingEvents = {}
+
+    def segment_event(self, segment):
+        """Return a popped segment, or None if it has been cancelled by a
+        later event on the same plug.
+        """
+        if segment[4]:
+            plug = segment[2]
+            if self.pendingEvents.get(plug) != segment[1]:
+                return None
+            del self.pendingEvents[plug]
+        return segment
 
     def propagate(self):
-        """Propagate the events of tge queue: pop closest event and execute it
-        then continue until no event remains on the queue.
+        """Propagate the events of the queue: pop closest event and execute it
+        then continue until no event remains on the queue. Events scheduled
+        by the executed ones are run by the same loop, so a nested call
+        returns at once and the propagation depth never grows the stack.
         """
-        if self.is_empty():
-            return 1
-        proc = self.pop_first_item()
+        if self.propagating:
+            return
+        self.propagating = True
+        horizon = self.horizon
         try:
-            proc()
-        except RuntimeError:
-            return 0
-        return self.propagate()
+            while not self.is_empty():
+                if horizon is not None and self.next_time() > horizon:
+                    break
+                segment = self.pop_first_item()
+                if segment is not None:
+                    segment[2].do_set(segment[3])
+                    self.nbEvents += 1
+        finally:
+            self.propagating = False
 
     def pop_first_item(self):
-        """Return the nearest event of the queue."""
-        segment = self.timeSegments[0]
+        """Return the nearest event segment of the queue, in O(log n), or
+        None if it has been cancelled.
+        """
+        segment = heappop(self.timeSegments)
         self.currentTime = segment[0]
-        self.timeSegments = self.timeSegments[1:]
         # here we can implement simu speed with segment[0] - self.currentTime
-        return segment[1]
+        return self.segment_event(segment)
 
-    def schedule(self, gate, proc):
-        """Add an event segment (execution time, function, function name) to
-        the events queue.
+    def schedule(self, gate, plug, value):
+        """Add an event segment (execution time, sequence number, plug,
+        value, inertial) to the events queue: plug will be set to value after
+        the delay of the gate. If the gate is inertial, the pending event of
+        the plug is cancelled.
         """
+        inertial = gate.inertial
+        if inertial:
+            if plug in self.pendingEvents:
+                self.nbCancelled += 1
+            self.pendingEvents[plug] = self.sequenceNb
         self.add_segment(
-            self.get_current_time() + gate.delay,
-            proc,
-            gate.__class__.__name__ + ' evalfun')
+            self.currentTime + gate.delay, plug, value, inertial)
+
+
+class TimingWheelAgenda(Agenda):
+    """An Agenda backed by a timing wheel (calendar queue): a circular array
+    of FIFO buckets, one per time unit over the next wheelSize units. As the
+    builtin gates have small integer delays, scheduling and popping an event
+    are O(1). Events farther than wheelSize are kept in the overflow heap
+    (timeSegments) and moved to the wheel when the time comes near.
+    Times must be integers. The heap is not slower though for the few
+    pending events of the builtin circuits, heapq being written in C.
+    """
+    def __init__(self, wheelSize=64):
+        Agenda.__init__(self)
+        self.wheelSize = wheelSize
+        self.buckets = [deque() for i in range(wheelSize)]
+        self.nbWheelSegments = 0
+
+    def is_empty(self):
+        """Return True if there is no scheduled action."""
+        return not (self.nbWheelSegments or self.timeSegments)
+
+    def add_segment(self, time, plug, value, inertial=False):
+        """Put a segment in its bucket, or in the overflow heap if it is
+        too far away.
+        """
+        if time - self.currentTime < self.wheelSize:
+            self.buckets[time % self.wheelSize].append(
+                (time, self.sequenceNb, plug, value, inertial))
+            self.nbWheelSegments += 1
+            self.sequenceNb += 1
+        else:
+            Agenda.add_segment(self, time, plug, value, inertial)
+
+    def next_time(self):
+        """Return the time of the nearest segment, the queue not being
+        empty.
+        """
+        if not self.nbWheelSegments:
+            return self.timeSegments[0][0]
+        time = self.currentTime
+        while not self.buckets[time % self.wheelSize]:
+            time += 1
+        return time
+
+    def advance(self, time):
+        """Set the current time and move the overflow segments which now
+        fit in the wheel to their buckets.
+        """
+        self.currentTime = time
+        horizon = time + self.wheelSize
+        while self.timeSegments and self.timeSegments[0][0] < horizon:
+            segment = heappop(self.timeSegments)
+            self.buckets[segment[0] % self.wheelSize].append(segment)
+            self.nbWheelSegments += 1
+
+    def clear(self):
+        """Drop every scheduled action."""
+        Agenda.clear(self)
+        for bucket in self.buckets:
+            bucket.clear()
+        self.nbWheelSegments = 0
+
+    def pop_first_item(self):
+        """Return the nearest event segment of the queue, or None if it has
+        been cancelled.
+        """
+        if not self.nbWheelSegments:    # jump to the first overflow segment
+            self.advance(self.timeSegments[0][0])
+        time = self.currentTime
+        while not self.buckets[time % self.wheelSize]:
+            time += 1
+        if time != self.currentTime:
+            self.advance(time)
+        self.nbWheelSegments -= 1
+        return self.segment_event(
+            self.buckets[time % self.wheelSize].popleft())
+
+
+class Simulation:
+    """The context of a simulation: the agenda on which the events are
+    scheduled, the state used to detect unstable connections and the
+    statistics. Every root Circuit owns one, shared with all its
+    sub-circuits, so independent circuits can be simulated side by side.
+    """
+    # A plug which changes more often than that at one time, or than that
+    # many times the number of changed plugs during one settle, is part of
+    # an unstable loop.
+    oscillationLimit = 20
+
+    def __init__(self, agenda=None, oscillationLimit=None):
+        """agenda is the event queue, an Agenda by default."""
+        self.agenda = Agenda() if agenda is None else agenda
+        if oscillationLimit is not None:
+            self.oscillationLimit = oscillationLimit
+        """evalCounts counts the value changes of each plug at countTime,
+        settleCounts since the last settle began. exceed is set when one
+        goes over its limit.
+        """
+        self.evalCounts = {}
+        self.countTime = None
+        self.settleCounts = {}
+        self.exceed = False
+        """unstableLoop is the list of circuits of the last unstable loop."""
+        self.unstableLoop = []
+        """nbSettles counts the Plug.set() calls coming from the outside."""
+        self.nbSettles = 0
+        """nbChanges counts the Plug value changes."""
+        self.nbChanges = 0
+        """batchDepth counts the nested Circuit.batch() being built,
+        batchGates are the gates whose inputs changed meanwhile."""
+        self.batchDepth = 0
+        self.batchGates = {}
+        """clocks are the VirtualClocks toggling plugs of the simulation."""
+        self.clocks = []
+        """lock is held by the threads changing the circuits: the clock
+        thread and the GUI thread."""
+        self.lock = RLock()
+        """tracer gets the value changes of the plugs, see set_tracing(),
+        or is None."""
+        self.tracer = None
+
+    def __getstate__(self):
+        """A lock can't be copied nor pickled, nor the file a tracer may
+        write to: leave them out.
+        """
+        state = dict(self.__dict__)
+        del state['lock']
+        del state['tracer']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = RLock()
+        self.tracer = None
+
+    def reset_stability(self):
+        """Start watching for an unstable connection again."""
+        self.evalCounts = {}
+        self.countTime = None
+        self.settleCounts = {}
+        self.exceed = False
+
+    def oscillation(self, plug):
+        """Stop the propagation of an unstable loop. The loop is made of the
+        circuits of the plugs which changed during the settle at least half
+        as often as plug, the one which went over a limit.
+        """
+        self.exceed = True
+        self.agenda.clear()
+        for clock in self.clocks:     # their next edges were cleared too
+            clock.running = False
+        nb = self.settleCounts[plug]
+        self.unstableLoop = sorted(
+            set([other.owner for other, otherNb in self.settleCounts.items()
+                if otherNb * 2 >= nb]),
+            key=lambda circuit: circuit.name)
+
+    def settle(self, circuit):
+        """Settle the changes made during a batch at once. The gates of
+        circuit which are not sequential are evaluated once in rank order,
+        with no delay, then the sequential gates, and the events these
+        schedule are propagated. If the other gates form a loop, the gates
+        whose inputs changed are evaluated and their events propagated
+        instead. The outputs of the circuits of an unstable loop are set to
+        None.
+        """
+        from .netlist import Netlist    # which imports this module
+        gates = self.batchGates
+        self.batchGates = {}
+        self.nbSettles += 1
+        self.reset_stability()
+        try:
+            netlist = Netlist(circuit)
+        except ValueError:              # a circuit has no logic()
+            netlist = None
+        if netlist is not None and netlist.evaluate_combinational():
+            changed = netlist.update_plugs()
+            self.nbChanges += len(changed)
+            if self.tracer is not None:
+                for plug in changed:
+                    self.tracer.record(plug)
+            gates = [gate for gate in netlist.gates if gate.sequential]
+        for gate in gates:
+            gate.evalfun()
+        self.agenda.propagate()
+        self.check_stability()
+
+    @locked
+    def run(self, until):
+        """Run the events up to the time until, then set the time to until:
+        the VirtualClocks toggle their plugs meanwhile, as fast as possible.
+        The later events wait for the next run() while a clock is running,
+        otherwise the previous horizon is restored.
+        """
+        agenda = self.agenda
+        previous = agenda.horizon
+        agenda.horizon = until
+        try:
+            self.nbSettles += 1
+            self.reset_stability()
+            agenda.propagate()
+            self.check_stability()
+            if agenda.currentTime < until:
+                agenda.advance(until)
+        finally:
+            if not any([clock.running for clock in self.clocks]):
+                agenda.horizon = previous
+
+    def check_stability(self):
+        """After a propagation, log the unstable loop if there is one and
+        set the outputs of its circuits to None.
+        """
+        if self.exceed:
+            log.warning(Plug.str_unstable % (', '.join(
+                [circuit.name for circuit in self.unstableLoop]),))
+            unstableLoop = self.unstableLoop
+            self.reset_stability()
+            for circuit in unstableLoop:
+                for plug in circuit.outputList:
+                    plug.do_set(None)
+            self.agenda.propagate()
+        if self.tracer is not None:
+            self.tracer.flush()
+
+    def set_tracing(self, inputs, outputs, size=1000):
+        """Trace the value changes of the inputs and/or the outputs, keeping
+        up to size changes between two flushes. With neither, tracing is
+        off and costs nothing.
+        """
+        self.tracer = Tracer(inputs, outputs, size) if inputs or outputs \
+            else None
+
+    def set_agenda(self, agenda):
+        """Replace the agenda, e.g. by a TimingWheelAgenda. It must be done
+        between two propagations, when no event is scheduled.
+        """
+        agenda.currentTime = self.agenda.currentTime
+        self.agenda = agenda
+
+    def statistics(self):
+        """Return the counters of the simulation."""
+        return {
+            'time': self.agenda.currentTime,
+            'settles': self.nbSettles,
+            'changes': self.nbChanges,
+            'events': self.agenda.nbEvents,
+            'cancelled': self.agenda.nbCancelled}
+
+
+def set_state(obj, state):
+    """Restore a pickled object. The .crc files saved before __slots__
+    hold a dict, the later ones a (dict or None, slots dict) tuple.
+    """
+    if isinstance(state, tuple):
+        state = dict(state[0] or {}, **state[1])
+    for name, value in state.items():
+        setattr(obj, name, value)
+
+
+class Tracer:
+    """Record the value changes of the plugs in a bounded ring buffer and
+    log them in one message when flushed. inputs and outputs choose which
+    plugs are traced. Only the last size changes are kept.
+    """
+    def __init__(self, inputs=True, outputs=True, size=1000):
+        self.inputs = inputs
+        self.outputs = outputs
+        self.records = deque(maxlen=size)
+        """nbDropped counts the changes overwritten before a flush."""
+        self.nbDropped = 0
+
+    def record(self, plug):
+        """Record the new value of a plug, if its category is traced."""
+        if self.inputs if plug.isInput else self.outputs:
+            if len(self.records) == self.records.maxlen:
+                self.nbDropped += 1
+            self.records.append((plug, plug.value))
+
+    def flush(self):
+        """Log the recorded changes and empty the buffer."""
+        if not self.records:
+            return
+        lines = [
+            (plug.str_inputV if plug.isInput else plug.str_outputV)
+            % (plug.owner.name, plug.name, str(value),)
+            for plug, value in self.records]
+        if self.nbDropped:
+            lines.insert(0, '... (%i)' % (self.nbDropped,))
+        log.info('\n'.join(lines))
+        self.records.clear()
+        self.nbDropped = 0
+
+
+class ChainedTracer:
+    """A tracer which takes the place of the tracer of a simulation while
+    it records, between attach() and detach(). The previous tracer gets the
+    changes and the flushes too, so a VcdWriter and a WaveformStore may
+    record at once. Subclasses record the changes in record_change().
+    """
+    def __init__(self, simulation):
+        self.simulation = simulation
+        """previous is the tracer replaced while recording."""
+        self.previous = None
+
+    def attach(self):
+        """Become the tracer of the simulation."""
+        self.previous = self.simulation.tracer
+        self.simulation.tracer = self
+
+    def detach(self):
+        """Give the simulation its previous tracer back."""
+        if self.simulation.tracer is self:
+            self.simulation.tracer = self.previous
+        self.previous = None
+
+    def record(self, plug):
+        """Pass the change to the previous tracer, then record it."""
+        if self.previous is not None:
+            self.previous.record(plug)
+        self.record_change(plug)
+
+    def record_change(self, plug):
+        """Record the new value of a plug."""
+        raise NotImplementedError
+
+    def flush(self):
+        """End of a settle: flush the previous tracer."""
+        if self.previous is not None:
+            self.previous.flush()
+
+
+class NameIndex:
+    """The names of a list of components (the sub-circuits, inputs or
+    outputs of a circuit) and the first number which may be free after each
+    prefix of the generated names, to check and generate names without
+    scanning the list.
+    """
+    __slots__ = ('names', 'nextFree')
+
+    def __init__(self, components):
+        """names counts the components which have each name."""
+        self.names = {}
+        """nextFree is the first number which may be free after a prefix."""
+        self.nextFree = {}
+        for component in components:
+            if component.name is not None:
+                self.add(component.name)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def add(self, name):
+        """Add the name of a component."""
+        self.names[name] = self.names.get(name, 0) + 1
+
+    def remove(self, name):
+        """Remove the name of a component, its number becomes free."""
+        nb = self.names.get(name, 0)
+        if nb > 1:
+            self.names[name] = nb - 1
+            return
+        self.names.pop(name, None)
+        for prefix, number in self.nextFree.items():
+            digits = name[len(prefix):]
+            if (name.startswith(prefix) and digits.isdecimal()
+                    and str(int(digits)) == digits and int(digits) < number):
+                self.nextFree[prefix] = int(digits)
+
+    def generate(self, prefix):
+        """Return the name made of prefix and the lowest free number."""
+        number = self.nextFree.get(prefix, 0)
+        while prefix + str(number) in self.names:
+            number += 1
+        self.nextFree[prefix] = number
+        return prefix + str(number)
 
 
 class Plug:
     """Represents an input or output."""
+    __slots__ = (
+        'isInput', 'owner', 'name', 'value', '__nbEval', 'sourcePlug',
+        'destinationPlugs')
     # Verbosity options :
     addPlugVerbose = True       # Log self.__init__()?
-    setInputVerbose = True      # Log input.set()?
-    setOutputVerbose = True     # Log output.set()?
     connectVerbose = True       # Log i/o.connect()?
 
     def __init__(self, isInput, name, owner):
@@ -111,16 +570,19 @@ class Plug:
         self.isInput = isInput
         """owner is the parent of the Plug, the circuit which contain it."""
         self.owner = owner
+        self.name = None
         self.generate_name(name)
         """value is the signal value of the Plug: True, False or None."""
         self.value = False
         self.__nbEval = 0
         """sourcePlug is the plug wich forward its value to this Plug."""
         self.sourcePlug = None
-        """destinationPlugs are the plugs which receive this Plug's value."""
-        self.destinationPlugs = []
+        """destinationPlugs are the plugs which receive this Plug's value,
+        as the keys of a dict: in connection order, removed in O(1)."""
+        self.destinationPlugs = {}
         if self.isInput:            # Add plug to owner.
             owner.inputList.append(self)
+            owner.refresh_inputs()
             if Plug.addPlugVerbose:
                 log.info(self.str_inputAdded % (self.name, owner.name,))
         else:
@@ -128,6 +590,12 @@ class Plug:
             if Plug.addPlugVerbose:
                 log.info(self.str_outputAdded % (self.name, owner.name,))
 
+    def __setstate__(self, state):
+        set_state(self, state)
+        if isinstance(self.destinationPlugs, list):     # older .crc files
+            self.destinationPlugs = dict.fromkeys(self.destinationPlugs)
+
+    @locked
     def connect(self, other):
         """Connects two plugs, or logs the reason why not."""
         if self == other:
@@ -177,7 +645,7 @@ class Plug:
                         % (other.owner.name, other.name,))
                     return False
                 else:
-                    self.destinationPlugs.append(other)
+                    self.destinationPlugs[other] = None
                     other.sourcePlug = self
                     other.set(self.value)
             else:   # origin is other
@@ -187,7 +655,7 @@ class Plug:
                         % (self.owner.name, self.name,))
                     return False
                 else:
-                    other.destinationPlugs.append(self)
+                    other.destinationPlugs[self] = None
                     self.sourcePlug = other
                     self.set(other.value)
             if Plug.connectVerbose:
@@ -197,6 +665,7 @@ class Plug:
                         self.name,))
             return True
      
+    @locked
     def disconnect(self, other):
         """Disconnect two plugs."""
         # Invalid disconnection.
@@ -208,11 +677,11 @@ class Plug:
                 % (self.owner.name, self.name, other.owner.name, other.name,))
             return
         elif other in self.destinationPlugs:     # source = self
-            self.destinationPlugs.remove(other)
+            del self.destinationPlugs[other]
             other.sourcePlug = None
             other.set(0)
         else:                                   # source = other
-            other.destinationPlugs.remove(self)
+            del other.destinationPlugs[self]
             self.sourcePlug = None
             self.set(0)
         log.info(
@@ -221,99 +690,135 @@ class Plug:
 
     def generate_name(self, name, prefix=None):
         """Generate a name for a plug."""
-        i = 0
-        names = [io.name for io in (
-            self.owner.inputList if self.isInput else self.owner.outputList)]
+        listName = 'inputList' if self.isInput else 'outputList'
+        names = self.owner.name_index(listName)
         if name and prefix:
             name = None
-        if name and name not in names:
-            self.name = name
-            return
-        prefix = prefix if prefix else ('in' if self.isInput else 'out')
-        while True:
-            name = prefix + str(i)
-            if name not in names:
-                self.name = name
-                return
-            i += 1
+        if not name or name in names:
+            name = names.generate(
+                prefix if prefix else ('in' if self.isInput else 'out'))
+        self.owner.index_name(listName, self.name, name)
+        self.name = name
 
+    @locked
     def set(self, value, forced=False):
-        """Try to set the value of a Plug. If the connection don't became
-        stable set the value to None.
+        """Try to set the value of a Plug and propagate the change through
+        the circuit. If the connection don't became stable set the value to
+        None.
         """
-        global exceed_
-        exceed_ = False
+        simulation = self.owner.simulation
+        if simulation.agenda.propagating:   # set by an event: agenda goes on
+            self.do_set(value, forced)
+            return
+        if simulation.batchDepth:   # building: the batch end propagates
+            simulation.reset_stability()
+            self.do_set(value, forced)
+            return
+        simulation.nbSettles += 1
+        simulation.reset_stability()
         self.do_set(value, forced)
-        if exceed_:
-            self.do_set(None)
+        simulation.agenda.propagate()
+        simulation.check_stability()
 
     def do_set(self, value, forced=False):
-        """Sets the boolean value of a Plug."""
-        global recursionNb_
-        global gateList_
-        global exceed_
-        # no change, nothing to do.
-        if self.value == value and self.__nbEval != 0 and not forced:
-            return
-        # If you reach the recursion limit: stop, let set() set it to unstable
-        recursionNb_ += 1
-        if self.owner not in gateList_:
-            gateList_.append(self.owner)
-        if recursionNb_ > len(gateList_) * 10:
-            recursionNb_ = 0
-            gateList_ = []
-            exceed_ = True
-            return
-        # else set the new value and update the circuit accordingly
-        self.value = value
-        if not forced:
-            self.__nbEval += 1
-        if Plug.setInputVerbose and self.isInput:
-            log.info(
-                self.str_inputV % (self.owner.name, self.name,
-                str(self.value),))
-        if Plug.setOutputVerbose and not self.isInput:
-            log.info(
-                self.str_outputV % (self.owner.name, self.name,
-                str(self.value),))
-        # gate input changed: set outputs values
-        if self.isInput:
-            self.owner.evalfun()
-        agenda_.propagate()
-        # then, all plugs in the destination list are set to the same value
-        for dest in self.destinationPlugs:
-            dest.do_set(value)
-        recursionNb_ -= 1
-        gateList_ = []
+        """Sets the boolean value of a Plug and forwards it to every plug
+        of its net. The net is walked with an explicit stack, in the order
+        of the destinationPlugs; gates whose input changed schedule
+        their outputs on the agenda instead of setting them right away.
+        Once an unstable loop is found, or during a batch, the walk still
+        sets the whole net but the gates only count their inputs again.
+        """
+        simulation = self.owner.simulation
+        batchGates = simulation.batchGates if simulation.batchDepth else None
+        currentTime = simulation.agenda.currentTime
+        if simulation.countTime != currentTime:    # a new time step
+            simulation.countTime = currentTime
+            simulation.evalCounts = {}
+        evalCounts = simulation.evalCounts
+        settleCounts = simulation.settleCounts
+        limit = simulation.oscillationLimit
+        tracer = simulation.tracer
+        pending = [self]
+        while pending:
+            plug = pending.pop()
+            # no change, nothing to do.
+            if plug.value == value and plug.__nbEval != 0 and not forced:
+                continue
+            # Too many changes: stop, let set() set it to unstable
+            if not simulation.exceed:
+                nb = evalCounts.get(plug, 0) + 1
+                evalCounts[plug] = nb
+                settleNb = settleCounts.get(plug, 0) + 1
+                settleCounts[plug] = settleNb
+                if nb > limit or settleNb > limit * len(settleCounts):
+                    simulation.oscillation(plug)
+            simulation.nbChanges += 1
+            # else set the new value and update the circuit accordingly
+            previous = plug.value
+            plug.value = value
+            if not forced:
+                plug.__nbEval += 1
+            if tracer is not None:
+                tracer.record(plug)
+            # gate input changed: schedule outputs values
+            if plug.isInput:
+                if batchGates is not None:
+                    batchGates[plug.owner] = None
+                    plug.owner.refresh_inputs()
+                elif simulation.exceed:
+                    plug.owner.refresh_inputs()
+                else:
+                    plug.owner.input_changed(previous, value)
+            # then, all plugs in the destination list get the same value
+            pending.extend(reversed(plug.destinationPlugs))
+            forced = False
 
     def setName(self, name):
         """Set the name of the plug."""
         if not len(name):
             log.error(self.str_nameLen)
             return False
-        names = (
-            [x.name for x in self.owner.inputList] if self.isInput
-            else [x.name for x in self.owner.outputList])
-        if name in names:
+        listName = 'inputList' if self.isInput else 'outputList'
+        if name in self.owner.name_index(listName):
             log.error(self.str_unavailableName % (name,))
             return False
         else:
             log.info(self.str_newName % (self.owner.name, self.name, name,))
+            self.owner.index_name(listName, self.name, name)
             self.name = name
             return True
 
 
 class Circuit:
-    """Represents a logic circuit."""
+    """Represents a logic circuit. Its subclasses which only add class
+    attributes declare empty __slots__ too, to stay small.
+    """
+    __slots__ = (
+        'owner', 'simulation', 'name', 'category', 'inputList', 'outputList',
+        'circuitList', 'nameIndexes')
     # Verbosity options :
     addCircuitVerbose = True      # Log self.add_circuit()?
     removePlugVerbose = True      # Log self.remove_plug()?
     removeCircuitVerbose = True   # Log self.remove_circuit()?
     detailedRemoveVerbose = True  # ?
+    # Stateless gates cancel their pending output events, see Agenda.
+    inertial = False
+    # The logic() of sequential circuits also reads their current outputs
+    # and their state, the values of their stateNames, and returns the new
+    # state: a Netlist keeps the state of each gate.
+    sequential = False
+    stateNames = ()
+    # Shorter lists are scanned to check names, longer ones get a NameIndex.
+    nameIndexMin = 16
 
-    def __init__(self, name, owner, category=None):
+    def __init__(self, name, owner, category=None, simulation=None):
         """owner is the parent of the Circuit, the Circuit containing it."""
         self.owner = owner
+        """simulation is shared with the owner, root Circuits get their own."""
+        if owner:
+            self.simulation = owner.simulation
+        else:
+            self.simulation = simulation if simulation else Simulation()
         self.name = self.generate_name() if name is None else name
         """category is used to identify user Circuits."""
         self.category = category
@@ -323,28 +828,75 @@ class Circuit:
         self.outputList = []
         """circuitList is the list of all sub-Circuits of the Circuit."""
         self.circuitList = []
+        """nameIndexes are the NameIndex of the long lists, by list name."""
+        self.nameIndexes = None
         log.info(self.str_circuitCreated % (self.class_name(), self.name,))
         if owner:
             owner.circuitList.append(self)
+            owner.index_name('circuitList', None, self.name)
             if Circuit.addCircuitVerbose:
                 log.info(
                     self.str_circuitAdded
                     % (self.class_name(), self.name, self.owner.name,))
 
+    def __getstate__(self):
+        """Leave the simulation and the name indexes out of the saved or
+        copied state: add() binds the circuit to the simulation of its new
+        owner, the indexes are built again when needed.
+        """
+        state = dict(getattr(self, '__dict__', {}))
+        for cls in self.__class__.__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if hasattr(self, name):
+                    state[name] = getattr(self, name)
+        del state['simulation']
+        del state['nameIndexes']
+        return state
+
+    def __setstate__(self, state):
+        set_state(self, state)
+        self.simulation = None      # bound by add() or set_simulation()
+        self.nameIndexes = None
+
+    @contextmanager
+    def batch(self):
+        """Context in which components and connections are added without
+        propagating each change: the plugs set in the with block only set
+        their nets, the gates are not evaluated. At the end of the
+        outermost batch, Simulation.settle() evaluates the whole circuit
+        once.
+        """
+        simulation = self.simulation
+        root = self
+        while root.owner is not None:
+            root = root.owner
+        with simulation.lock:
+            simulation.batchDepth += 1
+            try:
+                yield self
+            finally:
+                simulation.batchDepth -= 1
+                if not simulation.batchDepth:
+                    simulation.settle(root)
+
     def init_inputs(self):
         """Force set all Circuit inputs to False."""
         for inp in self.inputList:
             inp.set(False, True)
 
+    @locked
     def add(self, component):
         """Used when loading circuits, to add pre-existing components."""
         component.owner = self
         if isinstance(component, Circuit):
-            self.circuitList.append(component)
+            component.set_simulation(self.simulation)
+            listName = 'circuitList'
         elif component.isInput:
-            self.inputList.append(component)
+            listName = 'inputList'
         else:
-            self.outputList.append(component)
+            listName = 'outputList'
+        getattr(self, listName).append(component)
+        self.index_name(listName, None, component.name)
 
     def class_name(self):
         """Return the class name of this circuit."""
@@ -355,21 +907,58 @@ class Circuit:
         self.inputList = []
         self.outputList = []
         self.circuitList = []
+        self.nameIndexes = None
 
     def evalfun(self):
         """Only builtin gates have an evalfun."""
         pass
 
+    def input_changed(self, previous, value):
+        """Called when an input changed from previous to value."""
+        self.evalfun()
+
+    def refresh_inputs(self):
+        """Called when the input values were set directly, not by do_set(),
+        or when an input is added or removed: builtin gates which count
+        their input values count them again.
+        """
+        pass
+
+    def schedule(self, plug, value):
+        """Schedule plug to be set to value on the agenda after self.delay."""
+        self.simulation.agenda.schedule(self, plug, value)
+
     def generate_name(self):
         """Generate a name for this circuit."""
-        i = 0
-        className = self.class_name()
-        names = [circuit.name for circuit in self.owner.circuitList]
-        while True:
-            name = className + str(i)
-            if name not in names:
-                return name
-            i += 1
+        return self.owner.name_index('circuitList').generate(
+            self.class_name())
+
+    def name_index(self, listName):
+        """Return the NameIndex of the circuitList, inputList or outputList
+        of the circuit. It is kept up to date once the list is long enough,
+        shorter lists get a new one.
+        """
+        if self.nameIndexes is not None and listName in self.nameIndexes:
+            return self.nameIndexes[listName]
+        components = getattr(self, listName)
+        index = NameIndex(components)
+        if len(components) >= Circuit.nameIndexMin:
+            if self.nameIndexes is None:
+                self.nameIndexes = {}
+            self.nameIndexes[listName] = index
+        return index
+
+    def index_name(self, listName, oldName, newName):
+        """Update the NameIndex of a list, if it is kept, when a component
+        is added (oldName is None), removed (newName is None) or renamed.
+        """
+        if self.nameIndexes is None or listName not in self.nameIndexes:
+            return
+        index = self.nameIndexes[listName]
+        if oldName is not None:
+            index.remove(oldName)
+        if newName is not None:
+            index.add(newName)
 
     def nb_inputs(self):
         """Returns the number of inputs in the circuit."""
@@ -379,6 +968,7 @@ class Circuit:
         """Returns the number of outputs in the circuit."""
         return len(self.outputList)
 
+    @locked
     def remove(self, component):
         """Remove a component (Plug or Circuit) from the circuit."""
         if isinstance(component, Plug):
@@ -400,8 +990,12 @@ class Circuit:
         if isinstance(component, Plug):     # Remove the item.
             if component.sourcePlug:
                 component.sourcePlug.disconnect(component)
-            for i in range(len(component.destinationPlugs)):
-                component.disconnect(component.destinationPlugs[0])
+            for destination in list(component.destinationPlugs):
+                component.disconnect(destination)
+            for clock in [clock for clock in self.simulation.clocks
+                    if clock.plug is component]:
+                clock.stop()
+                self.simulation.clocks.remove(clock)
         else:
             for plug in component.inputList + component.outputList:
                 component.remove(plug)
@@ -411,6 +1005,7 @@ class Circuit:
     def remove_circuit(self, circuit):
         """Remove a circuit from the circuitList of the circuit."""
         self.circuitList.remove(circuit)
+        self.index_name('circuitList', circuit.name, None)
         Circuit.removePlugVerbose
         if Circuit.removeCircuitVerbose:
             log.info(
@@ -420,29 +1015,34 @@ class Circuit:
     def remove_input(self, input):
         """Remove an input from the inputList of the circuit."""
         self.inputList.remove(input)
+        self.index_name('inputList', input.name, None)
+        self.refresh_inputs()
         if Circuit.removePlugVerbose:
             log.info(self.str_inputRem % (input.name, self.name,))
 
     def remove_output(self, output):
         """Remove an output from the outputList of the circuit."""
         self.outputList.remove(output)
+        self.index_name('outputList', output.name, None)
         if Circuit.removePlugVerbose:
             log.info(self.str_outputRem % (output.name, self.name,))
 
+    def set_simulation(self, simulation):
+        """Bind the circuit and its sub-circuits to a simulation."""
+        self.simulation = simulation
+        for circuit in self.circuitList:
+            circuit.set_simulation(simulation)
+
     def setName(self, name):
         """Set the name of this circuit."""
         if not len(name):
             log.error(self.str_nameLen)
             return False
-        elif name in [x.name for x in self.owner.circuitList]:
+        elif name in self.owner.name_index('circuitList'):
             log.error(self.str_unavailableName % (name,))
             return False
         else:
             log.info(self.str_newName % (self.owner.name, self.name, name,))
+            self.owner.index_name('circuitList', self.name, name)
             self.name = name
             return True
-
-###############################################################################
-###############################################################################
-# the main agenda use for the simulation, there should be only one agenda
-agenda_ = Agenda()
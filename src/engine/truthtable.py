@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+
+###############################################################################
+#         ╔╦╗┌─┐┌─┐┬┌─┐  ╔═╗┬┬─┐┌─┐┬ ┬┬┌┬┐  ╔═╗┬┌┬┐┬ ┬┬  ┌─┐┌┬┐┌─┐┬─┐         #
+#         ║║║├─┤│ ┬││    ║  │├┬┘│  │ ││ │   ╚═╗│││││ ││  ├─┤ │ │ │├┬┘         #
+#         ╩ ╩┴ ┴└─┘┴└─┘  ╚═╝┴┴└─└─┘└─┘┴ ┴   ╚═╝┴┴ ┴└─┘┴─┘┴ ┴ ┴ └─┘┴└─         #
+# -+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+- #
+#                                                                        2014 #
+#                                                           Sébastien MAGNIEN #
+#                                                            Mathieu FOURCROY #
+# --------------------------------------------------------------------------- #
+# Exhaustive truth tables. The 2^n input combinations are evaluated by chunks #
+# of rows with the bit-parallel evaluator and written as they are computed,   #
+# so the memory used does not depend on the number of inputs.                 #
+###############################################################################
+
+
+from .bitparallel import evaluate_planes
+from .netlist import Netlist
+
+
+def input_planes(nbInputs, base, width):
+    """Return the ones planes of the inputs for the rows base to
+    base + width - 1 of the table. The first input is the most significant
+    bit of the row number and width is a power of two dividing base.
+    """
+    mask = (1 << width) - 1
+    planes = []
+    for i in range(nbInputs):
+        bit = nbInputs - 1 - i
+        period = 1 << bit
+        if period >= width:
+            planes.append(mask if base >> bit & 1 else 0)
+        else:
+            plane = ((1 << period) - 1) << period
+            size = period * 2
+            while size < width:
+                plane |= plane << size
+                size *= 2
+            planes.append(plane)
+    return planes
+
+
+def plane_column(one, unknown, width):
+    """Return the values of a net as a string of 0, 1 and X, one per row."""
+    column = format(one, '0%ib' % (width,))[::-1]
+    if not unknown:
+        return column
+    unknowns = format(unknown, '0%ib' % (width,))[::-1]
+    return ''.join([
+        'X' if u == '1' else c for c, u in zip(column, unknowns)])
+
+
+def value_char(value):
+    """Return the character of a value in the table."""
+    return 'X' if value is None else ('1' if value else '0')
+
+
+def truth_table(circuit, out, chunkBits=12):
+    """Write the truth table of circuit to the file object out: a header
+    with the input and output names, then one row per input combination.
+    Return the number of rows in which each output is None (unstable).
+    Combinational circuits are evaluated 2^chunkBits rows at a time, the
+    others one row at a time with the event-driven netlist.
+    """
+    netlist = Netlist(circuit)
+    nbInputs = len(netlist.inputs)
+    nbRows = 1 << nbInputs
+    out.write(' '.join([plug.name for plug in circuit.inputList]) + ' | '
+        + ' '.join([plug.name for plug in circuit.outputList]) + '\n')
+    unknownRows = [0] * len(netlist.outputs)
+    if netlist.is_combinational():
+        width = 1 << min(chunkBits, nbInputs)
+        unknowns = [0] * nbInputs
+        for base in range(0, nbRows, width):
+            ones = input_planes(nbInputs, base, width)
+            netOnes, netUnknowns = evaluate_planes(
+                netlist, ones, unknowns, width)
+            columns = [plane_column(one, 0, width) for one in ones]
+            columns.append('|' * width)
+            for i, net in enumerate(netlist.outputs):
+                columns.append(
+                    plane_column(netOnes[net], netUnknowns[net], width))
+                unknownRows[i] += bin(netUnknowns[net]).count('1')
+            out.write('\n'.join(map(' '.join, zip(*columns))) + '\n')
+    else:
+        netlist.settle()
+        for row in range(nbRows):
+            vector = [
+                bool(row >> (nbInputs - 1 - i) & 1) for i in range(nbInputs)]
+            netlist.set_nets(list(zip(netlist.inputs, vector)))
+            outputs = [netlist.values[net] for net in netlist.outputs]
+            for i, value in enumerate(outputs):
+                if value is None:
+                    unknownRows[i] += 1
+            out.write(' '.join(map(value_char, vector)) + ' | '
+                + ' '.join(map(value_char, outputs)) + '\n')
+    return dict(zip([plug.name for plug in circuit.outputList], unknownRows))
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+
+###############################################################################
+#         ╔╦╗┌─┐┌─┐┬┌─┐  ╔═╗┬┬─┐┌─┐┬ ┬┬┌┬┐  ╔═╗┬┌┬┐┬ ┬┬  ┌─┐┌┬┐┌─┐┬─┐         #
+#         ║║║├─┤│ ┬││    ║  │├┬┘│  │ ││ │   ╚═╗│││││ ││  ├─┤ │ │ │├┬┘         #
+#         ╩ ╩┴ ┴└─┘┴└─┘  ╚═╝┴┴└─└─┘└─┘┴ ┴   ╚═╝┴┴ ┴└─┘┴─┘┴ ┴ ┴ └─┘┴└─         #
+# -+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+- #
+#                                                                        2014 #
+#                                                           Sébastien MAGNIEN #
+#                                                            Mathieu FOURCROY #
+# --------------------------------------------------------------------------- #
+# Waveform export. The VcdWriter takes the place of the tracer of the         #
+# simulation: Plug.do_set hands it each value change, which it writes to a    #
+# Value Change Dump file stamped with the current time of the agenda. The     #
+# changes are buffered and written by blocks, nothing is kept once written.   #
+###############################################################################
+
+
+from .simulator import ChainedTracer
+
+
+VCD_VALUES = {False: '0', True: '1', None: 'x'}
+
+
+def vcd_code(number):
+    """Return the VCD identifier of a number: printable characters, from
+    '!' to '~'.
+    """
+    code = chr(33 + number % 94)
+    number //= 94
+    while number:
+        code += chr(33 + number % 94)
+        number //= 94
+    return code
+
+
+def vcd_name(name):
+    """Return a name without the spaces VCD doesn't allow."""
+    return '_'.join(str(name).split()) or '_'
+
+
+def circuit_plugs(circuit):
+    """Return the plugs of a circuit and of all its sub-circuits."""
+    plugs = []
+    pending = [circuit]
+    while pending:
+        component = pending.pop()
+        plugs.extend(component.inputList + component.outputList)
+        pending.extend(reversed(component.circuitList))
+    return plugs
+
+
+class VcdWriter(ChainedTracer):
+    """Record the value changes of plugs of a circuit to a VCD file, which
+    waveform viewers (e.g. GTKWave) read. plugs are the recorded plugs, all
+    the plugs of the circuit and its sub-circuits by default; those added
+    later are not recorded. One time unit of the agenda is written as
+    timescale. The changes are written bufferSize at a time: call close()
+    at the end.
+    """
+    def __init__(self, fileName, circuit, plugs=None, timescale='1ns',
+            bufferSize=10000):
+        """circuit is the root of the scopes in the file."""
+        ChainedTracer.__init__(self, circuit.simulation)
+        self.fileName = fileName
+        self.circuit = circuit
+        self.timescale = timescale
+        self.bufferSize = bufferSize
+        plugs = circuit_plugs(circuit) if plugs is None else plugs
+        """codes are the VCD identifiers of the recorded plugs."""
+        self.codes = dict(
+            [(plug, vcd_code(i)) for i, plug in enumerate(plugs)])
+        """buffer holds the lines not yet written."""
+        self.buffer = []
+        self.lastTime = None
+        self.file = None
+        """nbChanges counts the recorded value changes."""
+        self.nbChanges = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        """Write the header and the current values, then record the
+        changes.
+        """
+        self.file = open(self.fileName, 'w')
+        self.file.write(
+            '$version Logic Circuit Simulator $end\n'
+            '$timescale %s $end\n' % (self.timescale,))
+        self.write_scope(self.circuit)
+        self.file.write('$enddefinitions $end\n')
+        self.lastTime = self.simulation.agenda.currentTime
+        self.buffer.append('#%i\n$dumpvars\n' % (self.lastTime,))
+        for plug, code in self.codes.items():
+            self.buffer.append(VCD_VALUES[plug.value] + code + '\n')
+        self.buffer.append('$end\n')
+        self.attach()
+
+    def write_scope(self, circuit):
+        """Declare the recorded plugs of a circuit and of its sub-circuits,
+        in one scope per circuit.
+        """
+        lines = ['$scope module %s $end\n' % (vcd_name(circuit.name),)]
+        for plug in circuit.inputList + circuit.outputList:
+            if plug in self.codes:
+                lines.append('$var wire 1 %s %s $end\n' % (
+                    self.codes[plug], vcd_name(plug.name)))
+        self.file.write(''.join(lines))
+        for child in circuit.circuitList:
+            self.write_scope(child)
+        self.file.write('$upscope $end\n')
+
+    def record_change(self, plug):
+        """Record the new value of a plug if it is recorded."""
+        code = self.codes.get(plug)
+        if code is None:
+            return
+        time = self.simulation.agenda.currentTime
+        if time != self.lastTime:
+            self.lastTime = time
+            self.buffer.append('#%i\n' % (time,))
+        self.buffer.append(VCD_VALUES[plug.value] + code + '\n')
+        self.nbChanges += 1
+        if len(self.buffer) >= self.bufferSize:
+            self.write_buffer()
+
+    def write_buffer(self):
+        """Write the buffered lines to the file."""
+        self.file.write(''.join(self.buffer))
+        self.buffer = []
+
+    def close(self):
+        """Stop recording, write the buffered changes and close the file."""
+        self.detach()
+        if self.file is not None:
+            self.write_buffer()
+            self.file.close()
+            self.file = None
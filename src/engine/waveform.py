@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+
+###############################################################################
+#         ╔╦╗┌─┐┌─┐┬┌─┐  ╔═╗┬┬─┐┌─┐┬ ┬┬┌┬┐  ╔═╗┬┌┬┐┬ ┬┬  ┌─┐┌┬┐┌─┐┬─┐         #
+#         ║║║├─┤│ ┬││    ║  │├┬┘│  │ ││ │   ╚═╗│││││ ││  ├─┤ │ │ │├┬┘         #
+#         ╩ ╩┴ ┴└─┘┴└─┘  ╚═╝┴┴└─└─┘└─┘┴ ┴   ╚═╝┴┴ ┴└─┘┴─┘┴ ┴ ┴ └─┘┴└─         #
+# -+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+- #
+#                                                                        2014 #
+#                                                           Sébastien MAGNIEN #
+#                                                            Mathieu FOURCROY #
+# --------------------------------------------------------------------------- #
+# Waveforms kept in memory. Like the VcdWriter, the WaveformStore takes the   #
+# place of the tracer of the simulation and gets each value change. A         #
+# Waveform only keeps the changes: their times in an array of integers and    #
+# their values packed four per byte. The value at a time is found by a binary #
+# search on the times.                                                        #
+###############################################################################
+
+
+from array import array
+from bisect import bisect_left, bisect_right
+import sys
+from .gates import CODES
+from .simulator import ChainedTracer
+from .vcd import circuit_plugs
+
+
+# The value of each code of CODES.
+VALUES = (False, True, None)
+
+
+class Waveform:
+    """The history of a plug: the times at which its value changed and the
+    new values, 2 bits each. Two successive changes never have the same
+    value nor the same time: the last change at a time replaces the others.
+    """
+    __slots__ = ('times', 'values')
+
+    def __init__(self):
+        self.times = array('q')
+        """values holds the code of the value of change i in the bits
+        2 * (i % 4) of its byte i // 4."""
+        self.values = bytearray()
+
+    def __len__(self):
+        return len(self.times)
+
+    def code(self, i):
+        """Return the code of the value of change i."""
+        return self.values[i >> 2] >> ((i & 3) << 1) & 3
+
+    def append(self, time, value):
+        """Add a change of the value at time, not before the last one."""
+        code = CODES[value]
+        nb = len(self.times)
+        if nb and self.times[-1] == time:     # replaces the last change
+            nb -= 1
+            self.times.pop()
+            if nb & 3:
+                self.values[-1] &= ~(3 << ((nb & 3) << 1))
+            else:
+                self.values.pop()
+        if nb and self.code(nb - 1) == code:
+            return
+        self.times.append(time)
+        if nb & 3:
+            self.values[-1] |= code << ((nb & 3) << 1)
+        else:
+            self.values.append(code)
+
+    def value_at(self, time):
+        """Return the value at time, None before the first change."""
+        i = bisect_right(self.times, time) - 1
+        return None if i < 0 else VALUES[self.code(i)]
+
+    def changes(self, start, end):
+        """Return the (time, value) of the changes from start to end
+        excluded, starting with the value at start.
+        """
+        first = bisect_right(self.times, start)
+        last = bisect_left(self.times, end, first)
+        changes = [(start, self.value_at(start))]
+        changes.extend([
+            (self.times[i], VALUES[self.code(i)])
+            for i in range(first, last)])
+        return changes
+
+    def memory(self):
+        """Return the bytes used by the times and the values."""
+        return sys.getsizeof(self.times) + sys.getsizeof(self.values)
+
+
+class WaveformStore(ChainedTracer):
+    """Keep the Waveform of plugs of a circuit, all the plugs of the
+    circuit and its sub-circuits by default. The times are those of the
+    agenda.
+    """
+    def __init__(self, circuit, plugs=None):
+        ChainedTracer.__init__(self, circuit.simulation)
+        plugs = circuit_plugs(circuit) if plugs is None else plugs
+        self.waveforms = dict([(plug, Waveform()) for plug in plugs])
+        self.recording = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def __getitem__(self, plug):
+        return self.waveforms[plug]
+
+    def start(self):
+        """Add the current values, then record the changes."""
+        if self.recording:
+            return
+        time = self.simulation.agenda.currentTime
+        for plug, waveform in self.waveforms.items():
+            waveform.append(time, plug.value)
+        self.attach()
+        self.recording = True
+
+    def stop(self):
+        """Stop recording, the waveforms are kept."""
+        self.detach()
+        self.recording = False
+
+    def record_change(self, plug):
+        """Record the new value of a plug if it is recorded."""
+        waveform = self.waveforms.get(plug)
+        if waveform is not None:
+            waveform.append(self.simulation.agenda.currentTime, plug.value)
+
+    def value_at(self, plug, time):
+        """Return the value of a plug at time."""
+        return self.waveforms[plug].value_at(time)
+
+    def changes(self, plug, start, end):
+        """Return the changes of a plug from start to end excluded."""
+        return self.waveforms[plug].changes(start, end)
+
+    def nb_changes(self):
+        """Return the number of changes kept."""
+        return sum([len(waveform) for waveform in self.waveforms.values()])
+
+    def memory(self):
+        """Return the bytes used by the waveforms."""
+        return sum([
+            sys.getsizeof(waveform) + waveform.memory()
+            for waveform in self.waveforms.values()])
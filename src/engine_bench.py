@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################
+##       quelques mesures de performance du moteur        ##
+##     usage : python3 engine_bench.py [nb de cycles]      ##
+#############################################################
+
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from engine.simulator import (
+    log, load_strings, Agenda, Circuit, Plug, TimingWheelAgenda)
+from engine.circuits import Counter4b, JKFlipFlop, Register4b
+from engine.clock import VirtualClock
+from engine.gates import (
+    count_inputs, input_counts, lookup, AndGate, NandGate, NorGate, NotGate,
+    OrGate, XnorGate, XorGate)
+from engine.cyclebased import CycleSimulator
+from engine.netlist import Netlist
+from engine.vcd import circuit_plugs, VcdWriter
+from engine.waveform import WaveformStore
+
+
+def clock_counter(cycles, agenda):
+    """Drive a Counter4b with a clock, return the elapsed time and the
+    simulation statistics.
+    """
+    C4 = Counter4b('C4', None)
+    C4.simulation.set_agenda(agenda)
+    C4.A.set(True)
+    start = time.perf_counter()
+    for i in range(cycles):
+        C4.CLK.set(True)
+        C4.CLK.set(False)
+    return time.perf_counter() - start, C4.simulation.statistics()
+
+
+def bench_agendas(cycles, runs=3):
+    """Compare the heap and the timing wheel agendas on a clocked design,
+    keeping the best of a few runs of each.
+    """
+    print('Counter4b, %i clock cycles:' % (cycles,))
+    heapTime = None
+    for agendaClass in [Agenda, TimingWheelAgenda]:
+        elapsed, stats = min(
+            [clock_counter(cycles, agendaClass()) for i in range(runs)],
+            key=lambda result: result[0])
+        heapTime = heapTime or elapsed
+        print('  %-20s %8.3f s   %10.0f cycles/s   %8i events   %8i cancelled'
+            '   %4.2f x Agenda' % (
+                agendaClass.__name__, elapsed, cycles / elapsed,
+                stats['events'], stats['cancelled'], heapTime / elapsed))
+
+
+def bench_virtual_clock(cycles):
+    """Drive a Counter4b with a VirtualClock, check it counts as with
+    Plug.set() then measure it.
+    """
+    expected = []
+    C4 = Counter4b('C4', None)
+    C4.A.set(True)
+    for i in range(20):
+        C4.CLK.set(True)
+        C4.CLK.set(False)
+        expected.append([q.value for q in C4.outputList])
+    C4 = Counter4b('C4', None)
+    C4.A.set(True)
+    clock = VirtualClock(C4.CLK)
+    for i in range(20):
+        clock.run(1)
+        assert [q.value for q in C4.outputList] == expected[i], i
+    start = time.perf_counter()
+    clock.run(cycles)
+    elapsed = time.perf_counter() - start
+    print('  %-20s %8.3f s   %10.0f cycles/s   %8i events' % (
+        'VirtualClock', elapsed, cycles / elapsed,
+        C4.simulation.agenda.nbEvents))
+
+
+def clock_domains(cycles, divider):
+    """Run a toggle flip-flop on a fast clock and another on a clock four
+    times slower, made by a second VirtualClock or by dividing the fast
+    one with two more flip-flops. Return the elapsed time, the simulation
+    and the slow flip-flop.
+    """
+    root = Circuit('domains', None)
+    fast = Plug(True, 'fast', root)
+    fastClock = VirtualClock(fast, 400)
+    flipFlops = [JKFlipFlop(None, root) for i in range(4 if divider else 2)]
+    for flipFlop in flipFlops:
+        flipFlop.J.set(True)
+        flipFlop.K.set(True)
+    fast.connect(flipFlops[0].CLK)
+    if divider:
+        fast.connect(flipFlops[1].CLK)
+        flipFlops[1].Q.connect(flipFlops[2].CLK)
+        flipFlops[2].Q.connect(flipFlops[3].CLK)
+    else:
+        slow = Plug(True, 'slow', root)
+        slowClock = VirtualClock(slow, 1600, phase=100)
+        slow.connect(flipFlops[1].CLK)
+        slowClock.start()
+    start = time.perf_counter()
+    fastClock.run(cycles)
+    elapsed = time.perf_counter() - start
+    assert fastClock.nbCycles == cycles
+    assert divider or slowClock.nbCycles == cycles // 4
+    return elapsed, root.simulation
+
+
+def bench_clock_domains(cycles):
+    """Compare two clock domains run by two VirtualClocks with a slow clock
+    made by a divider.
+    """
+    for name, divider in [('two clocks', False), ('clock divider', True)]:
+        elapsed, simulation = clock_domains(cycles, divider)
+        print('  %-20s %8.3f s   %10.0f cycles/s   %8i events' % (
+            name, elapsed, cycles / elapsed, simulation.agenda.nbEvents))
+
+
+def record_vcd(fileName, cycles):
+    """Record every plug of a Counter4b driven by a VirtualClock to a VCD
+    file, return the elapsed time and the writer.
+    """
+    C4 = Counter4b('C4', None)
+    C4.A.set(True)
+    clock = VirtualClock(C4.CLK)
+    clock.run(1)
+    start = time.perf_counter()
+    with VcdWriter(fileName, C4) as writer:
+        clock.run(cycles)
+    return time.perf_counter() - start, writer
+
+
+def bench_vcd(cycles):
+    """Measure the recording of a VCD file, then the memory it takes, which
+    must not grow with the number of cycles.
+    """
+    fileName = os.path.join(tempfile.mkdtemp(), 'counter.vcd')
+    elapsed, writer = record_vcd(fileName, cycles)
+    size = os.path.getsize(fileName)
+    tracemalloc.start()
+    record_vcd(fileName, cycles)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    os.remove(fileName)
+    os.rmdir(os.path.dirname(fileName))
+    print('  %-20s %8.3f s   %10.0f cycles/s   %8i changes %6.0f kB peak, '
+        '%i kB written' % (
+            'VcdWriter', elapsed, cycles / elapsed, writer.nbChanges,
+            peak / 1024, size / 1024))
+
+
+def bench_waveforms(cycles, queries):
+    """Keep the waveforms of every plug of a Counter4b driven by a
+    VirtualClock, measure their memory and the queries of values at random
+    times.
+    """
+    C4 = Counter4b('C4', None)
+    C4.A.set(True)
+    clock = VirtualClock(C4.CLK)
+    start = time.perf_counter()
+    with WaveformStore(C4) as store:
+        clock.run(cycles)
+    elapsed = time.perf_counter() - start
+    print('  %-20s %8.3f s   %10.0f cycles/s   %8i changes %6.1f bytes each'
+        % ('WaveformStore', elapsed, cycles / elapsed, store.nb_changes(),
+            store.memory() / store.nb_changes()))
+    plugs = list(store.waveforms)
+    end = C4.simulation.agenda.currentTime
+    random.seed(0)
+    requests = [
+        (random.choice(plugs), random.randrange(end)) for i in range(queries)]
+    start = time.perf_counter()
+    for plug, at in requests:
+        store.value_at(plug, at)
+    elapsed = time.perf_counter() - start
+    print('  %-20s %8.3f s   %10.0f queries/s' % (
+        'value_at', elapsed, queries / elapsed))
+
+
+def bench_netlist(cycles):
+    """Drive the compiled netlist of a Counter4b with a clock."""
+    C4 = Counter4b('C4', None)
+    netlist = Netlist(C4)
+    netlist.set(C4.A, True)
+    start = time.perf_counter()
+    for i in range(cycles):
+        netlist.set(C4.CLK, True)
+        netlist.set(C4.CLK, False)
+    elapsed = time.perf_counter() - start
+    print('  %-20s %8.3f s   %10.0f cycles/s   %8i events' % (
+        'Netlist', elapsed, cycles / elapsed, netlist.nbEvents))
+
+
+def bench_cycles(cycles):
+    """Drive a Counter4b clock cycle by clock cycle, and compare with the
+    event-driven simulation on the heap Agenda.
+    """
+    agendaTime = clock_counter(cycles, Agenda())[0]
+    C4 = Counter4b('C4', None)
+    C4.A.set(True)
+    simulator = CycleSimulator(C4, C4.CLK)
+    start = time.perf_counter()
+    simulator.run(cycles)
+    elapsed = time.perf_counter() - start
+    print('  %-20s %8.3f s   %10.0f cycles/s   %8i edges   %4.1f x Agenda'
+        % ('CycleSimulator', elapsed, cycles / elapsed, simulator.nbEdges,
+            agendaTime / elapsed))
+
+
+class DictPlug:
+    """A Plug keeping its attributes in a __dict__, as before __slots__."""
+    def __init__(self, plug):
+        """Copy the attributes of plug, in Plug.__init__() order."""
+        for name in Plug.__slots__:
+            name = '_Plug' + name if name.startswith('__') else name
+            setattr(self, name, getattr(plug, name))
+
+
+def bench_memory(gates):
+    """Measure the memory used by the gates and plugs of a large circuit,
+    and by a Plug against a copy of it keeping a __dict__.
+    """
+    root = Circuit('root', None)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(gates):
+        AndGate('AND%i' % (i,), root)
+    used = tracemalloc.get_traced_memory()[0] - before
+    plugs = [plug for gate in root.circuitList for plug in gate.inputList]
+    copies = [None] * len(plugs)
+    before = tracemalloc.get_traced_memory()[0]
+    for i, plug in enumerate(plugs):
+        copies[i] = DictPlug(plug)
+    dictPlugSize = (tracemalloc.get_traced_memory()[0] - before) / len(plugs)
+    tracemalloc.stop()
+    print('%i AndGates: %8.0f bytes per gate, %4i bytes per Plug object '
+        '(%.0f with a __dict__)' % (
+            gates, used / gates, sys.getsizeof(plugs[0]), dictPlugSize))
+
+
+def bench_names(gates):
+    """Measure the creation of unnamed gates in one circuit, which each get
+    a generated name, and of as many unnamed inputs.
+    """
+    root = Circuit('root', None)
+    start = time.perf_counter()
+    for i in range(gates):
+        AndGate(None, root)
+    gatesTime = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(gates):
+        Plug(True, None, root)
+    print('%i unnamed gates: %8.3f s, inputs: %8.3f s' % (
+        gates, gatesTime, time.perf_counter() - start))
+
+
+def bench_fanout(destinations):
+    """Measure connecting an input of a circuit to many gates, then
+    disconnecting and removing it.
+    """
+    root = Circuit('root', None)
+    source = Plug(True, 'clk', root)
+    gates = [AndGate(None, root) for i in range(destinations)]
+    start = time.perf_counter()
+    for gate in gates:
+        source.connect(gate.inputList[0])
+    connectTime = time.perf_counter() - start
+    start = time.perf_counter()
+    for gate in gates[::2]:
+        source.disconnect(gate.inputList[0])
+    disconnectTime = time.perf_counter() - start
+    start = time.perf_counter()
+    root.remove(source)
+    print('fan-out of %i: connect %8.3f s, disconnect half %8.3f s, '
+        'remove %8.3f s' % (destinations, connectTime, disconnectTime,
+        time.perf_counter() - start))
+
+
+def build_chain(root, gates):
+    """Build a chain of NotGates driven by an input of root, connecting it
+    from its end so that each connection propagates down the chain.
+    """
+    chain = [NotGate(None, root) for i in range(gates)]
+    for previous, gate in reversed(list(zip(chain, chain[1:]))):
+        previous.outputList[0].connect(gate.inputList[0])
+    Plug(True, 'in', root).connect(chain[0].inputList[0])
+    return chain
+
+
+def build_circuits(root, circuitClass, nb):
+    """Build nb circuitClass in root."""
+    return [circuitClass(None, root) for i in range(nb)]
+
+
+def bench_batch(gates, circuits):
+    """Compare the construction of a chain of gates, and of Counter4b and
+    Register4b, with and without Circuit.batch(), and check they end in
+    the same state.
+    """
+    for title, build in [
+            ('chain of %i NotGates' % (gates,),
+                lambda root: build_chain(root, gates)),
+            ('%i Counter4b' % (circuits,),
+                lambda root: build_circuits(root, Counter4b, circuits)),
+            ('%i Register4b' % (circuits,),
+                lambda root: build_circuits(root, Register4b, circuits))]:
+        print('%s:' % (title,))
+        values = []
+        for batch in (False, True):
+            root = Circuit('root', None)
+            start = time.perf_counter()
+            if batch:
+                with root.batch():
+                    build(root)
+            else:
+                build(root)
+            elapsed = time.perf_counter() - start
+            values.append([plug.value for plug in circuit_plugs(root)])
+            print('  %-10s %8.3f s %10i changes %8i events' % (
+                'batch' if batch else 'plain', elapsed,
+                root.simulation.nbChanges, root.simulation.agenda.nbEvents))
+        assert values[0] == values[1]
+
+
+def closure_event(gate, value):
+    """Return the event a gate scheduled before events were records: the
+    time, a closure setting its output and the name of the action.
+    """
+    return (gate.simulation.agenda.currentTime + gate.delay,
+        lambda: gate.outputList[0].set(value),
+        gate.__class__.__name__ + ' evalfun')
+
+
+def bench_event_memory(events):
+    """Measure the memory held by each event a NotGate schedules on the
+    agenda, as a plug and value record and as the closure it was before.
+    """
+    root = Circuit('root', None)
+    gates = [NotGate('NOT%i' % (i,), root) for i in range(100)]
+    agenda = root.simulation.agenda
+    closures = []
+    sizes = []
+    for schedule in [
+            lambda gate, value: closures.append(closure_event(gate, value)),
+            lambda gate, value: gate.schedule(gate.outputList[0], value)]:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(events):
+            schedule(gates[i % len(gates)], i % 2 == 0)
+        sizes.append(tracemalloc.get_traced_memory()[0] - before)
+        tracemalloc.stop()
+    assert len(closures) == len(agenda.timeSegments) == events
+    agenda.clear()
+    print('%i events: %8.1f bytes per closure, %8.1f bytes per record' % (
+        events, sizes[0] / events, sizes[1] / events))
+
+
+def bench_gates(evaluations):
+    """Compare the time of the evaluations of the gates by their logic(),
+    their truth table and their input counts. engine_check.py checks that
+    they agree.
+    """
+    root = Circuit('root', None)
+    print('%i evaluations:             logic()      table     counts'
+        % (evaluations,))
+    for gateClass in [
+            NotGate, AndGate, NandGate, OrGate, NorGate, XorGate, XnorGate]:
+        counting = hasattr(gateClass, 'count_logic')
+        for nbInputs in ([1] if gateClass is NotGate else [2, 4, 8, 16]):
+            gate = (gateClass('G', root) if gateClass is NotGate
+                else gateClass('G', root, nbInputs))
+            for inp in gate.inputList:
+                inp.value = True
+            gate.inputList[0].value = None
+            start = time.perf_counter()
+            for i in range(evaluations):
+                gate.logic([inp.value for inp in gate.inputList])
+            logicTime = time.perf_counter() - start
+            start = time.perf_counter()
+            for i in range(evaluations):
+                lookup(gate)
+            tableTime = time.perf_counter() - start
+            countsTime = '       -'
+            if counting:
+                count_inputs(gate)
+                start = time.perf_counter()
+                for i in range(evaluations):
+                    gate.count_logic(input_counts(gate, None, None))
+                countsTime = '%8.3f s' % (time.perf_counter() - start,)
+            print('  %-10s %2i inputs %8.3f s  %8.3f s  %s' % (
+                gateClass.__name__, nbInputs, logicTime, tableTime,
+                countsTime))
+            root.remove(gate)
+
+
+if __name__ == '__main__':
+    load_strings()
+    log.setLevel(logging.ERROR)
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    bench_agendas(cycles)
+    bench_virtual_clock(cycles)
+    bench_clock_domains(cycles)
+    bench_vcd(cycles)
+    bench_waveforms(cycles, 100000)
+    bench_netlist(cycles)
+    bench_cycles(cycles)
+    bench_memory(10000)
+    bench_names(5000)
+    bench_fanout(5000)
+    bench_batch(1000, 20)
+    bench_event_memory(100000)
+    bench_gates(cycles * 100)
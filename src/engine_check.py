@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################
+##     quelques vérifications du comportement du moteur    ##
+##             usage : python3 engine_check.py             ##
+#############################################################
+
+import logging
+import pickle
+from contextlib import nullcontext
+from copy import deepcopy
+from threading import Thread
+from engine.simulator import log, load_strings, Circuit, Plug, Simulation
+from itertools import product
+from engine.gates import (
+    gate_table, AndGate, NandGate, NorGate, NotGate, OrGate, XnorGate,
+    XorGate)
+from engine.circuits import Counter4b, DFlipFlop, Register4b
+from engine.clock import VirtualClock
+from engine.cyclebased import CycleSimulator
+from engine.faults import FaultSimulator, fault_name
+from engine.vcd import circuit_plugs
+from engine.waveform import WaveformStore
+from engine.netlist import Netlist
+
+
+def number(values):
+    """Return the number written by values, the first being the LSB."""
+    return sum([bool(value) << i for i, value in enumerate(values)])
+
+
+# The evalfun() of the gates before the truth tables and the input counts,
+# on a list of values, quirks included.
+def not_evalfun(values):
+    val = not values[0]
+    if values[0] is None:
+        val = None
+    return val
+
+
+def and_evalfun(values):
+    val = all(values)
+    for value in values:
+        if value is None and val:
+            val = None
+    return val
+
+
+def nand_evalfun(values):
+    val = not all(values)
+    for i, value in enumerate(values):
+        if value is None:
+            for value2 in values:
+                if value2 is False:
+                    val = True
+            t = True
+            for j, value2 in enumerate(values):
+                if j != i and value2 is not True:
+                    t = False
+            if t:
+                val = None
+    return val
+
+
+def or_evalfun(values):
+    val = any(values)
+    for value in values:
+        if value is None and not val:
+            val = None
+    return val
+
+
+def nor_evalfun(values):
+    val = not any(values)
+    for value in values:
+        if value is None and not val:
+            val = None
+    return val
+
+
+def xor_evalfun(values):
+    return values.count(True) % 2 == 1    # the None inputs were ignored
+
+
+def xnor_evalfun(values):
+    return all(values) or not any(values)
+
+
+EVALFUNS = {
+    NotGate: not_evalfun, AndGate: and_evalfun, NandGate: nand_evalfun,
+    OrGate: or_evalfun, NorGate: nor_evalfun, XorGate: xor_evalfun,
+    XnorGate: xnor_evalfun}
+
+
+def check_counter(cycles=18):
+    """Check that a Counter4b counts 1, 2, ... 15, 0, 1 ... with Plug.set(),
+    a VirtualClock, its netlist and the cycle-based simulator.
+    """
+    expected = [(i + 1) % 16 for i in range(cycles)]
+    counts = {}
+    C4 = Counter4b('C4', None)
+    C4.A.set(True)
+    counts['Plug.set'] = []
+    for i in range(cycles):
+        C4.CLK.set(True)
+        C4.CLK.set(False)
+        counts['Plug.set'].append(number([q.value for q in C4.outputList]))
+    C4 = Counter4b('C4', None)
+    C4.A.set(True)
+    clock = VirtualClock(C4.CLK)
+    counts['VirtualClock'] = []
+    for i in range(cycles):
+        clock.run(1)
+        counts['VirtualClock'].append(
+            number([q.value for q in C4.outputList]))
+    C4 = Counter4b('C4', None)
+    netlist = Netlist(C4)
+    netlist.set(C4.A, True)
+    counts['Netlist'] = []
+    for i in range(cycles):
+        netlist.set(C4.CLK, True)
+        netlist.set(C4.CLK, False)
+        counts['Netlist'].append(number(
+            [netlist.values[net] for net in netlist.outputs]))
+    C4 = Counter4b('C4', None)
+    C4.A.set(True)
+    simulator = CycleSimulator(C4, C4.CLK)
+    counts['CycleSimulator'] = []
+    for i in range(cycles):
+        simulator.cycle()
+        counts['CycleSimulator'].append(
+            number([simulator.value(q) for q in C4.outputList]))
+    for name, count in counts.items():
+        assert count == expected, '%s counts %s' % (name, count)
+
+
+def check_pickle():
+    """Check that a pickled circuit holds no Simulation and counts again
+    once added to a circuit.
+    """
+    C4 = Counter4b('C4', None)
+    C4.A.set(True)
+    data = pickle.dumps(C4, pickle.HIGHEST_PROTOCOL)
+    assert Simulation.__name__.encode() not in data, 'Simulation pickled'
+    C4 = pickle.loads(data)
+    main = Circuit('main', None)
+    main.add(C4)
+    assert all([circuit.simulation is main.simulation
+        for circuit in C4.circuitList]), 'sub-circuits not bound'
+    for i in range(3):
+        C4.CLK.set(True)
+        C4.CLK.set(False)
+    count = number([q.value for q in C4.outputList])
+    assert count == 3, 'counts %i' % (count,)
+
+
+def check_unstable_loop():
+    """Check that the outputs of an OR/NOT ring are set to None when it
+    oscillates, every plug of a net keeping the same value.
+    """
+    root = Circuit('root', None)
+    notGate = NotGate('not', root)
+    orGate = OrGate('or', root)
+    i = Plug(True, 'i', root)
+    i.connect(orGate.inputList[0])
+    orGate.outputList[0].connect(notGate.inputList[0])
+    notGate.outputList[0].connect(orGate.inputList[1])
+    i.set(True)
+    assert (notGate.outputList[0].value, orGate.outputList[0].value) == \
+        (False, True), 'stable ring'
+    i.set(False)
+    assert (notGate.outputList[0].value, orGate.outputList[0].value) == \
+        (None, None), 'unstable ring'
+    for plug in [notGate.outputList[0], orGate.outputList[0]]:
+        for destination in plug.destinationPlugs:
+            assert destination.value == plug.value, 'net half set'
+
+
+def check_wide_fanout(width=25):
+    """Check that the plugs of a wide circuit with no loop changing at
+    once are not taken for an unstable loop.
+    """
+    root = Circuit('root', None)
+    i = Plug(True, 'i', root)
+    for k in range(width):
+        i.connect(Plug(False, None, root))
+    i.set(True)
+    assert set([plug.value for plug in root.outputList]) == set([True]), \
+        'fan-out of an input'
+    root = Circuit('root', None)
+    clock = Plug(True, 'clk', root)
+    for k in range(width):
+        gate = NotGate(None, root)
+        clock.connect(gate.inputList[0])
+        gate.outputList[0].connect(Plug(False, None, root))
+    virtualClock = VirtualClock(clock)
+    for k in range(3):
+        virtualClock.run(1)
+        assert set([plug.value for plug in root.outputList]) == \
+            set([True]), 'NotGates driven by a clock'
+    assert not root.simulation.unstableLoop, 'unstable loop'
+
+
+def check_batch(gates=30):
+    """Check that a chain of NotGates built in a batch ends in the same
+    state as one built without, with no unstable loop.
+    """
+    values = []
+    for batch in (False, True):
+        root = Circuit('root', None)
+        chain = [NotGate(None, root) for i in range(gates)]
+        with root.batch() if batch else nullcontext():
+            for previous, gate in reversed(list(zip(chain, chain[1:]))):
+                previous.outputList[0].connect(gate.inputList[0])
+            Plug(True, 'in', root).connect(chain[0].inputList[0])
+        assert not root.simulation.unstableLoop, 'unstable loop'
+        values.append([gate.outputList[0].value for gate in chain])
+    assert values[0] == values[1], 'batch gives %s' % (values[1],)
+    assert values[0] == [i % 2 == 0 for i in range(gates)], 'wrong chain'
+    for build in [Counter4b, Register4b, DFlipFlop, nor_latch]:
+        values = []
+        for batch in (False, True):
+            root = Circuit('root', None)
+            with root.batch() if batch else nullcontext():
+                build(None, root)
+            values.append([plug.value for plug in circuit_plugs(root)])
+        assert values[0] == values[1], '%s built in a batch' % (
+            build.__name__,)
+
+
+def nor_latch(name, owner):
+    """Build a latch of two NorGates, a loop which can't be ranked."""
+    latch = Circuit(name, owner)
+    nor0 = NorGate('NOR0', latch)
+    nor1 = NorGate('NOR1', latch)
+    nor0.outputList[0].connect(nor1.inputList[0])
+    nor1.outputList[0].connect(nor0.inputList[1])
+    return latch
+
+
+def check_faults(cycles=20):
+    """Check that the fault simulation of a Counter4b gives the same
+    verdicts whatever the order the faults are simulated in, and that the
+    circuit's own flip-flops are left untouched. A pickled simulator, as
+    in a spawned worker, gives them too.
+    """
+    C4 = Counter4b('C4', None)
+    C4.A.set(True)
+    vectors = [(True, i % 2 == 0) for i in range(2 * cycles + 1)]
+    simulator = FaultSimulator(C4)
+    states = [gate.prevClock for gate in simulator.netlist.gates
+        if gate.stateNames]
+    reports = [simulator.run(vectors, processes=1) for i in range(2)]
+    assert reports[0]['coverage'] == reports[1]['coverage'], \
+        'coverages %s' % ([report['coverage'] for report in reports],)
+    good = simulator.run_sequential(None, vectors)
+    detected = [
+        simulator.detect_sequential(faultClass, vectors, good)
+        for faultClass in reversed(simulator.classes)]
+    detected.reverse()
+    assert [simulator.faults[i] for i, faultClass
+        in enumerate(simulator.faultClasses) if detected[faultClass]] == \
+        reports[0]['detected'], 'verdicts depend on the order'
+    assert states == [gate.prevClock for gate in simulator.netlist.gates
+        if gate.stateNames], 'flip-flops changed'
+    simulator = pickle.loads(pickle.dumps(simulator))
+    report = simulator.run(vectors, processes=1)
+    assert [fault_name(fault) for fault in report['detected']] == \
+        [fault_name(fault) for fault in reports[0]['detected']], \
+        'pickled simulator'
+
+
+def check_run_horizon():
+    """Check that Simulation.run() only keeps its horizon while a clock is
+    running: a later Plug.set() propagates at once again.
+    """
+    root = Circuit('root', None)
+    notGate = NotGate('not', root)
+    i = Plug(True, 'i', root)
+    i.connect(notGate.inputList[0])
+    agenda = root.simulation.agenda
+    root.simulation.run(100)
+    assert agenda.horizon is None, 'horizon %s' % (agenda.horizon,)
+    i.set(True)
+    assert notGate.outputList[0].value is False, 'not propagated'
+    clock = VirtualClock(i)
+    clock.run(2)
+    assert agenda.horizon == agenda.currentTime, 'clock horizon'
+    clock.stop()
+    assert agenda.horizon is None, 'horizon after the clock'
+
+
+def check_input_counts():
+    """Check that the gates which count their inputs give the output of
+    their logic() after an input is removed, then another one added.
+    """
+    for gateClass in (AndGate, NandGate, OrGate, NorGate):
+        root = Circuit('root', None)
+        gate = gateClass(None, root, 3)
+        gate.inputList[0].set(True)
+        gate.inputList[1].set(None)
+        gate.inputList[2].set(True)
+        gate.remove(gate.inputList[2])
+        Plug(True, None, gate)
+        for values in [(True, None, True), (True, True, True),
+                (False, True, None), (None, None, False)]:
+            for inp, value in zip(gate.inputList, values):
+                inp.set(value)
+            assert gate.outputList[0].value == gateClass.logic(
+                list(values)), '%s%s gives %s' % (
+                gateClass.__name__, values, gate.outputList[0].value)
+
+
+def check_gates(maxInputs=5):
+    """Check that the logic(), the truth tables, the input counts and the
+    simulated gates give the output of the former evalfun() for every
+    combination of input values.
+    """
+    assert and_evalfun([True, None]) is False, 'AND(True, None)'
+    assert nor_evalfun([True, None]) is None, 'NOR(True, None)'
+    assert xor_evalfun([True, None]) is True, 'XOR(True, None)'
+    root = Circuit('root', None)
+    for gateClass, evalfun in EVALFUNS.items():
+        for nbInputs in ([1] if gateClass is NotGate
+                else range(2, maxInputs + 1)):
+            table = gate_table(gateClass, nbInputs)
+            gate = (gateClass(None, root) if gateClass is NotGate
+                else gateClass(None, root, nbInputs))
+            for i, values in enumerate(
+                    product((False, True, None), repeat=nbInputs)):
+                values = list(values)
+                expected = evalfun(values)
+                name = '%s%s' % (gateClass.__name__, tuple(values))
+                assert gateClass.logic(values) == expected, name
+                assert table is None or table[i] == expected, name
+                if hasattr(gateClass, 'count_logic'):
+                    assert gateClass.count_logic([
+                        values.count(False), values.count(True),
+                        values.count(None)]) == expected, name
+                for inp, value in zip(gate.inputList, values):
+                    inp.set(value)
+                assert gate.outputList[0].value == expected, name
+            root.remove(gate)
+
+
+def check_locks():
+    """Check that each simulation has its own lock: a circuit can be set
+    while another thread holds the lock of another simulation. A
+    Simulation is copied and pickled without its lock.
+    """
+    first = NotGate('first', None)
+    second = NotGate('second', None)
+    with first.simulation.lock:
+        thread = Thread(target=second.inputList[0].set, args=(True,))
+        thread.start()
+        thread.join(5)
+        assert not thread.is_alive(), 'blocked by another simulation'
+    assert second.outputList[0].value is False, 'not set'
+    simulation = pickle.loads(pickle.dumps(deepcopy(first.simulation)))
+    with simulation.lock:
+        assert simulation.lock is not first.simulation.lock, 'shared lock'
+
+
+def check_tracers():
+    """Check that the tracer of a simulation only gets the changes of its
+    circuits.
+    """
+    first = NotGate('first', None)
+    second = NotGate('second', None)
+    with WaveformStore(first) as store:
+        second.simulation.set_tracing(True, True)
+        first.inputList[0].set(True)
+        second.inputList[0].set(True)
+        assert first.simulation.tracer is store, 'tracer replaced'
+        assert len(second.simulation.tracer.records) == 0, 'not flushed'
+    assert first.simulation.tracer is None, 'tracer kept'
+    waveform = store[first.outputList[0]]
+    assert [waveform.value_at(time) for time in waveform.times] == \
+        [True, False], 'recorded %s' % (list(waveform.times),)
+
+
+if __name__ == '__main__':
+    load_strings()
+    log.setLevel(logging.ERROR)
+    checks = [check_counter, check_pickle, check_unstable_loop,
+        check_wide_fanout, check_batch, check_faults, check_run_horizon,
+        check_input_counts, check_gates, check_locks, check_tracers]
+    for check in checks:
+        check()
+        print('%-20s ok' % (check.__name__,))
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################
+##      table de vérité complète d'un circuit utilisateur    ##
+## usage : python3 engine_truthtable.py circuit.crc [sortie] ##
+#############################################################
+
+import logging
+import sys
+from engine.simulator import log, load_strings
+from engine.crcfile import load_circuit
+from engine.truthtable import truth_table
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('usage : python3 engine_truthtable.py circuit.crc [sortie]')
+        sys.exit(1)
+    load_strings()
+    log.setLevel(logging.ERROR)
+    circuit = load_circuit(sys.argv[1])
+    out = open(sys.argv[2], 'w') if len(sys.argv) > 2 else sys.stdout
+    unknownRows = truth_table(circuit, out)
+    if out is not sys.stdout:
+        out.close()
+    for name, nb in unknownRows.items():
+        if nb:
+            print('%s is unstable (None) in %i rows' % (name, nb),
+                file=sys.stderr)
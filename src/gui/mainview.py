@@ -13,7 +13,7 @@ from .selectionoptions import SelectionOptions
 from .toolbox import ToolBox
 from .util import closestGridPoint, distance, filePath, GRIDSIZE
 from engine.circuits import JKFlipFlop, RSFlipFlop
-from engine.clock import Clock, ClockThread
+from engine.clock import Clock, ClockThread, stop_clocks
 from engine.simulator import Circuit, Plug
 import engine
 
@@ -38,7 +38,6 @@ class MainView(QGraphicsView):
         self.timer.timeout.connect(self.setItemsInGrid)
         self.copyBuffer = None
         """A buffer for ctrl-c, ctrl-v copy operations."""
-        self.clockPlug = None
 
     def batchRename(self):
         """Experimental function to rename multiple items at once."""
@@ -63,8 +62,7 @@ class MainView(QGraphicsView):
             # https://bugreports.qt-project.org/browse/PYSIDE-252
             if not isinstance(i, QGraphicsSimpleTextItem):
                 self.scene().removeItem(i)
-        if self.bgClockThread:
-            self.bgClockThread.stop()
+        stop_clocks(self.mainCircuit.simulation)
         self.mainCircuit.clear()
 
     def clockUpdate(self):
@@ -75,8 +73,7 @@ class MainView(QGraphicsView):
 
     def closeEvent(self, e):
         """Overload in order to kill the clock thread."""
-        if self.bgClockThread is not None:
-            self.bgClockThread.exit()
+        stop_clocks(self.mainCircuit.simulation)
 
     def contextMenuEvent(self, e):
         """Pops a contextual menu up on right-clicks"""
@@ -142,27 +139,17 @@ class MainView(QGraphicsView):
         elif name == self.str_O:
             item = PlugItem(Plug(False, None, self.mainCircuit))
         elif name == self.str_Clock:
-            if not self.clockPlug:
-                self.clockPlug = Clock(self.mainCircuit)
-                self.clockPlug.clkThread.set_extern(self.clockUpdate)
-                item = PlugItem(self.clockPlug)
-            else:
-                self.write(self.str_onlyOneClock)
+            clock = Clock(self.mainCircuit)
+            clock.clkThread.set_extern(self.clockUpdate)
+            item = PlugItem(clock)
         elif model.item(0, 1).text() == 'user':
             c = Circuit(None, self.mainCircuit)
             f = open(filePath('user/') + name + '.crc', 'rb')
             children = pickle.load(f)
             f.close()
             for child in children:
-                if isinstance(child[0], Plug):
-                    child[0].owner = c
-                    if child[0].isInput:
-                        c.inputList.append(child[0])
-                    else:
-                        c.outputList.append(child[0])
-                elif isinstance(child[0], Circuit):
-                    child[0].owner = c
-                    c.circuitList.append(child[0])
+                if isinstance(child[0], Plug) or isinstance(child[0], Circuit):
+                    c.add(child[0])
             c.category = name
             item = CircuitItem(c)
         if item:
@@ -160,10 +160,10 @@ class MainWindow(QMainWindow):
         image.fill(QColor(self.config.get('Appearance', 'circ_bg_color')))
         image.setPixel(0, 0, QColor(0, 0, 0).rgb())
         self.view.scene().setBackgroundBrush(QBrush(QPixmap.fromImage(image)))
-        Plug.setInputVerbose = self.config.getboolean(
-            'LogVerbosity', 'input_chang')
-        Plug.setOutputVerbose = self.config.getboolean(
-            'LogVerbosity', 'output_chang')
+        self.view.mainCircuit.simulation.set_tracing(
+            self.config.getboolean('LogVerbosity', 'input_chang'),
+            self.config.getboolean('LogVerbosity', 'output_chang'),
+            self.config.getint('LogVerbosity', 'trace_size', fallback=1000))
         Plug.connectVerbose = self.config.getboolean(
             'LogVerbosity', 'conn_discon_io')
         Plug.addPlugVerbose = self.config.getboolean(
@@ -28,7 +28,8 @@ class ToolBox(QTreeWidget):
         for name, class_ in inspect.getmembers(
                 gates,
                 lambda m: (
-                    inspect.isclass(m) and m.__module__ == 'engine.gates')):
+                    inspect.isclass(m) and m.__module__ == 'engine.gates'
+                    and hasattr(m, 'logic'))):
             item = QTreeWidgetItem(gatesheader, [name[:-4]])
             item.setIcon(0, QIcon(imgDir + name + '.png'))
         item = QTreeWidgetItem(gatesheader, ['JKFlipFlop'])